@@ -1,28 +1,100 @@
+from utils.startup import StartupTimer, warm_up
+startup = StartupTimer()  # Before the Qt imports, to time them too
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QScrollArea, 
-    QFrame, QHBoxLayout, QLineEdit, QLabel, QCheckBox, QGridLayout, QComboBox, QFileDialog, QProgressBar
+    QFrame, QHBoxLayout, QLineEdit, QLabel, QCheckBox, QGridLayout, QComboBox, QFileDialog, QProgressBar,
+    QSpinBox, QPlainTextEdit, QDoubleSpinBox
 )
-from PyQt6.QtCore import Qt, QFileSystemWatcher, pyqtSignal, QThread, QTimer
+from PyQt6.QtCore import Qt, QTimer, QFileSystemWatcher, pyqtSignal
 import sys
 import os
 import json
 import re
-import yt_dlp
-import imageio_ffmpeg  # Ensures FFmpeg is available in the venv
-from utils.trimmer import trim_args
-ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
+from utils.jobs import (DownloadJob, DEFAULT_FRAGMENTS, submit_job, enable_media_cache,
+                        enable_info_cache, enable_ydl_pool, enable_rate_limits)
+from utils.journal import JobJournal, DEFAULT_JOURNAL_PATH
+from utils.playlist import PlaylistExpansion, is_playlist
+from utils.clips import parse_clips
+from utils.ratelimit import parse_rate, parse_schedule
+from utils.progress import ProgressThrottle, JsonlProgressLog, fan_out, format_event
+from utils.scheduler import Pipeline, QUEUED, DOWNLOADING, CONVERT_QUEUED, CONVERTING, FINISHED, FAILED, CANCELLED
+startup.mark("imports")
 SETTINGS_FILE = "settings.json"
-isDownloading = False
+DEFAULT_PARALLEL_DOWNLOADS = 3
 def is_valid_time_format(time_str):
     return re.match(r"^\d{2}:\d{2}:\d{2}$", time_str) is not None
 
 class YouTubeTrimmer(QWidget):
+    # (job, state, detail) emitted from scheduler worker threads
+    job_state = pyqtSignal(object, str, object)
+    # (job, progress event) emitted from worker threads, throttled
+    job_progress = pyqtSignal(object, object)
+    # card whose playlist has been listed completely (from the listing thread)
+    playlist_listed = pyqtSignal(object)
+    # emitted from the warm-up thread once yt-dlp is imported
+    warmed_up = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("YouTube Trimmer Tool")
         self.setGeometry(100, 100, 420, 550)
         
         self.last_selected_folder = self.load_last_selected_folder()
+        self.parallel_downloads = self.load_parallel_downloads()
+
+        settings = self.load_settings()
+        # Every state change is journaled from the worker thread right away,
+        # so a crash mid-batch loses nothing (see restore_unfinished_jobs).
+        self.journal = JobJournal(settings.get("journal_path", DEFAULT_JOURNAL_PATH))
+        # Starting a download imports yt-dlp (is_playlist), so starts wait
+        # for the warm-up thread instead of importing it on the GUI thread.
+        self.ready = False
+        self.pending_starts = []
+        self.warmed_up.connect(self.on_warmed_up)
+
+        # Downloads and conversions run on the pipeline's worker pools; each
+        # card hears about its jobs' states through the job_state signal. A
+        # playlist card owns one job per entry, so jobs map back to cards here
+        # until they end.
+        self.job_cards = {}
+        self.job_state.connect(self.on_job_state)
+        self.playlist_listed.connect(self.on_playlist_listed)
+        self.pipeline = Pipeline(self.parallel_downloads, on_state=self.journal.tracking(self.job_state.emit))
+
+        # Optional media cache: set "media_cache_dir" in settings.json to reuse
+        # sources when cutting several clips from the same video.
+        if settings.get("media_cache_dir"):
+            enable_media_cache(settings["media_cache_dir"], settings.get("media_cache_max_bytes"))
+        # Optional info cache: "info_cache_path" skips re-extracting recent URLs.
+        if settings.get("info_cache_path"):
+            enable_info_cache(settings["info_cache_path"], settings.get("info_cache_ttl"))
+        # Each download worker keeps one YoutubeDL (sessions, extractor state)
+        # across jobs; "ydl_pool": false in settings.json turns that off.
+        if settings.get("ydl_pool", True):
+            enable_ydl_pool()
+        # Shared bandwidth and per-site limits: "bandwidth_limit" ("4M"),
+        # "bandwidth_schedule" (["09:00-18:00=1M"]), "host_max_connections"
+        # and "host_requests_per_second".
+        try:
+            self.rate_limits = enable_rate_limits(parse_rate(settings.get("bandwidth_limit")),
+                                                  parse_schedule(settings.get("bandwidth_schedule")),
+                                                  settings.get("host_max_connections"),
+                                                  settings.get("host_requests_per_second"))
+        except ValueError as e:
+            print(f"Warning: ignoring rate limit settings: {e}")
+            self.rate_limits = enable_rate_limits()
+        # "fragments" is each job's DASH/HLS fragment concurrency and
+        # "max_connections" the budget shared by all running downloads.
+        self.fragments = settings.get("fragments", DEFAULT_FRAGMENTS)
+        if settings.get("max_connections"):
+            self.pipeline.connections.total = settings["max_connections"]
+
+        # Progress events go to the cards (throttled so hooks cannot flood the
+        # event loop) and, with "progress_log" in settings.json, to a JSONL file.
+        self.job_progress.connect(self.on_job_progress)
+        progress_log = JsonlProgressLog(settings["progress_log"]) if settings.get("progress_log") else None
+        self.report_progress = fan_out(ProgressThrottle(self.job_progress.emit), progress_log,
+                                       self.journal.progress)
 
         self.theme_selector = QComboBox()
         self.theme_selector.addItems(["Dark", "Light"])
@@ -33,6 +105,25 @@ class YouTubeTrimmer(QWidget):
         
         self.layout = QVBoxLayout(self)
         self.layout.addWidget(self.theme_selector)
+
+        parallel_layout = QHBoxLayout()
+        parallel_layout.addWidget(QLabel("Parallel downloads:"))
+        self.parallel_selector = QSpinBox()
+        self.parallel_selector.setRange(1, 16)
+        self.parallel_selector.setValue(self.parallel_downloads)
+        self.parallel_selector.valueChanged.connect(self.change_parallel_downloads)
+        parallel_layout.addWidget(self.parallel_selector)
+        self.layout.addLayout(parallel_layout)
+
+        # Takes effect on running downloads too (outside bandwidth_schedule windows).
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_layout.addWidget(QLabel("Bandwidth limit (MiB/s, 0 = off):"))
+        self.bandwidth_selector = QDoubleSpinBox()
+        self.bandwidth_selector.setRange(0, 10000)
+        self.bandwidth_selector.setValue((self.rate_limits.bandwidth.base_rate or 0) / 2**20)
+        self.bandwidth_selector.valueChanged.connect(self.change_bandwidth_limit)
+        bandwidth_layout.addWidget(self.bandwidth_selector)
+        self.layout.addLayout(bandwidth_layout)
         
         # Add the Download All button
         self.download_all_button = QPushButton("Download All")
@@ -55,6 +146,35 @@ class YouTubeTrimmer(QWidget):
         self.setLayout(self.layout)
         
         self.change_theme(0)
+        self.restore_unfinished_jobs()
+
+    def when_ready(self, callback):
+        """Run callback now, or once the warm-up has imported yt-dlp."""
+        if self.ready:
+            callback()
+        else:
+            self.pending_starts.append(callback)
+
+    def on_warmed_up(self):
+        self.ready = True
+        pending, self.pending_starts = self.pending_starts, []
+        for callback in pending:
+            callback()
+
+    def restore_unfinished_jobs(self):
+        """Re-add and restart the cards that were queued or running when the app stopped.
+
+        yt-dlp continues their .part files, so only the missing bytes are
+        fetched. The cards are shown right away; their downloads start once
+        the warm-up is done (see when_ready).
+        """
+        for job, partial_files in self.journal.unfinished():
+            print(f"↩️ Resuming {job.output_name} ({len(partial_files)} partial file(s))")
+            card = Card(self, job.folder)
+            card.load_job(job)
+            self.scroll_layout.addWidget(card)
+            card.start_download()
+        self.check_download_all_visibility()
     
     def get_default_download_folder(self):
         if sys.platform == "win32":
@@ -62,19 +182,39 @@ class YouTubeTrimmer(QWidget):
         else:
             return os.path.join(os.path.expanduser("~"), "Downloads")
     
-    def load_last_selected_folder(self):
+    def load_settings(self):
         if os.path.exists(SETTINGS_FILE):
             try:
                 with open(SETTINGS_FILE, "r") as file:
-                    settings = json.load(file)
-                    return settings.get("last_selected_folder", self.get_default_download_folder())
+                    return json.load(file)
             except (json.JSONDecodeError, FileNotFoundError):
                 pass
-        return self.get_default_download_folder()
+        return {}
+
+    def load_last_selected_folder(self):
+        return self.load_settings().get("last_selected_folder", self.get_default_download_folder())
+
+    def load_parallel_downloads(self):
+        return self.load_settings().get("parallel_downloads", DEFAULT_PARALLEL_DOWNLOADS)
     
     def save_last_selected_folder(self):
+        settings = self.load_settings()
+        settings["last_selected_folder"] = self.last_selected_folder
+        settings["parallel_downloads"] = self.parallel_downloads
         with open(SETTINGS_FILE, "w") as file:
-            json.dump({"last_selected_folder": self.last_selected_folder}, file)
+            json.dump(settings, file)
+
+    def change_parallel_downloads(self, value):
+        self.parallel_downloads = value
+        self.pipeline.downloads.set_max_workers(value)
+        self.save_last_selected_folder()
+
+    def change_bandwidth_limit(self, value):
+        self.rate_limits.bandwidth.set_rate(value * 2**20)
+        settings = self.load_settings()
+        settings["bandwidth_limit"] = f"{value}M" if value else None
+        with open(SETTINGS_FILE, "w") as file:
+            json.dump(settings, file)
     
     def add_card(self):
         card = Card(self, self.last_selected_folder)
@@ -87,31 +227,42 @@ class YouTubeTrimmer(QWidget):
         else:
             self.download_all_button.setVisible(False)
     def download_all(self):
-        # Iterate through all the cards and start their downloads
+        # Queue every valid card; the pipeline runs as many as its limits allow.
+        queued = 0
         for i in range(self.scroll_layout.count()):
             card = self.scroll_layout.itemAt(i).widget()
             if isinstance(card, Card) and card.download_button.isVisible():
-                all_valid = True
-                self.process_download(card, i)
-                break  # Stop after starting one download
+                card.start_download()
+                queued += 1
         
-        if not all_valid:
+        if not queued:
             print("No valid cards found for download.")
-    def process_download(self, card, index):
-        card.start_download()
-        card.download_button.setEnabled(False)  # Disable the button during download
-        self.monitor_download(card, index)
-
-    def monitor_download(self, card, index):
-        if card.is_downloading():  # Check if the download is still in progress
-            QTimer.singleShot(1000, lambda: self.monitor_download(card, index))
+
+    def submit_job(self, card, job):
+        # Also called from a playlist's listing thread, once per entry.
+        self.job_cards[job] = card
+        submit_job(self.pipeline, job)
+
+    def on_job_progress(self, job, event):
+        card = self.job_cards.get(job)
+        if card is not None and not card.removed:
+            card.set_progress(event)
+
+    def on_job_state(self, job, state, detail):
+        if state in (FINISHED, FAILED, CANCELLED):
+            card = self.job_cards.pop(job, None)
+        else:
+            card = self.job_cards.get(job)
+        if card is None or card.removed:
+            return
+        if card.expansion is not None:
+            card.set_entry_state(job, state, detail)
         else:
-            card.download_button.setEnabled(True)  # Re-enable button after completion
-            next_index = index + 1
-            if next_index < self.scroll_layout.count():
-                next_card = self.scroll_layout.itemAt(next_index).widget()
-                if isinstance(next_card, Card) and next_card.download_button.isVisible():
-                    self.process_download(next_card, next_index)          
+            card.set_job_state(state, detail)
+
+    def on_playlist_listed(self, card):
+        if not card.removed:
+            card.update_playlist_state()
 
     def load_stylesheet(self, filename):
         try:
@@ -137,6 +288,12 @@ class Card(QFrame):
         self.setFrameShape(QFrame.Shape.Box)
         self.parent = parent  
         self.is_downloading = False
+        self.job = None
+        # PlaylistExpansion when the URL is a playlist or channel; self.job
+        # is then only the template its entries are built from.
+        self.expansion = None
+        self.entries_failed = 0
+        self.removed = False
         layout = QVBoxLayout(self)
         
         top_layout = QHBoxLayout()
@@ -153,6 +310,9 @@ class Card(QFrame):
         self.folder_button = QPushButton("Select Folder")
         self.folder_button.clicked.connect(self.open_folder_dialog)
         
+        self.download_name_input = QLineEdit()
+        self.download_name_input.setPlaceholderText("Download under name:")
+
         self.delete_button = QPushButton("X")
         self.delete_button.clicked.connect(self.delete_card)
         
@@ -180,6 +340,14 @@ class Card(QFrame):
         self.partial_fields_widget = QWidget()
         self.partial_fields_widget.setLayout(self.partial_fields)
         self.partial_fields_widget.setVisible(False)
+
+        # Clip list: many clips cut from one download of the video.
+        self.clips_switch = QCheckBox("Clip list")
+        self.clips_switch.stateChanged.connect(self.toggle_clip_list)
+        self.clips_input = QPlainTextEdit()
+        self.clips_input.setPlaceholderText("One clip per line: start end name\n00:01:00 00:01:30 intro")
+        self.clips_input.setVisible(False)
+        self.clips_input.textChanged.connect(self.update_download_button)
         
         self.download_button = QPushButton("Download")
         self.download_button.setVisible(False)
@@ -187,18 +355,25 @@ class Card(QFrame):
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
         self.progress_bar.setVisible(False)
+        self.status_label = QLabel("")
+        self.status_label.setVisible(False)
 
         layout.addLayout(top_layout)
+        layout.addWidget(self.download_name_input)
         layout.addWidget(self.download_button)
         layout.addWidget(self.progress_bar)
+        layout.addWidget(self.status_label)
         layout.addWidget(self.quality_selector)
 
         self.url_input.textChanged.connect(self.update_download_button)
         self.switch.stateChanged.connect(self.update_download_button)
         self.from_input.textChanged.connect(self.update_download_button)
         self.to_input.textChanged.connect(self.update_download_button)
+        self.download_name_input.textChanged.connect(self.update_download_button)
         layout.addWidget(self.switch)
         layout.addWidget(self.partial_fields_widget)
+        layout.addWidget(self.clips_switch)
+        layout.addWidget(self.clips_input)
         layout.addWidget(self.download_button)
     
     def open_folder_dialog(self):
@@ -211,49 +386,173 @@ class Card(QFrame):
     
     def toggle_partial_fields(self):
         self.partial_fields_widget.setVisible(self.switch.isChecked())
+        if self.switch.isChecked():
+            self.clips_switch.setChecked(False)
         self.update_download_button()
+
+    def toggle_clip_list(self):
+        self.clips_input.setVisible(self.clips_switch.isChecked())
+        if self.clips_switch.isChecked():
+            self.switch.setChecked(False)
+        self.update_download_button()
+
+    def clips(self):
+        """The parsed clip list, or None when it is off or invalid."""
+        if not self.clips_switch.isChecked():
+            return None
+        try:
+            return parse_clips(self.clips_input.toPlainText()) or None
+        except ValueError:
+            return None
     
     def update_download_button(self):
         url_valid = bool(self.url_input.text().strip())
         folder_valid = bool(self.folder_input.text().strip())
+        download_name_valid = bool(self.download_name_input.text().strip())
         
         if self.switch.isChecked():
             from_valid = is_valid_time_format(self.from_input.text())
             to_valid = is_valid_time_format(self.to_input.text())
-            self.download_button.setVisible(url_valid and folder_valid and from_valid and to_valid)
+            self.download_button.setVisible(url_valid and folder_valid and download_name_valid and from_valid and to_valid)
+        elif self.clips_switch.isChecked():
+            self.download_button.setVisible(url_valid and folder_valid and download_name_valid
+                                            and self.clips() is not None)
         else:
-            self.download_button.setVisible(url_valid and folder_valid)
+            self.download_button.setVisible(url_valid and folder_valid and download_name_valid)
     
     def start_download(self):
         if self.is_downloading:
             return
-        ffmpeg_args = trim_args(self.from_input.text(),self.to_input.text())
-        print("folder to download into",self.folder_input.text())
-        opts = { #sometimes this mother fker can force the mp4 some time snot
-            "outtmpl": self.folder_input.text() +"input", #webm seems to be the most comfortable format to be downloaded in 
-            "external_downloader": ffmpeg_path,  # Use FFmpeg from venv
-            "external_downloader_args": ffmpeg_args,
-            "format": "bestvideo[height<="+self.quality_selector.currentText()[:-1]+"]+bestaudio/best",
-            "writesubtitles": False,
-            "writeautomaticsub": False,
-            "--merge-output-format": "mp4",
-            #lets keep it non quite for now
-            #"quiet": True,  # Suppresses output  
-            #"nocheckcertificate": True,  # Avoids SSL warnings  
-            #"ignoreerrors": True  # Prevents it from stopping on minor errors  
-        }
         url = self.url_input.text().strip()
         if not url:
             return
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            global isDownloading 
-            isDownloading = True
-            ydl.download(url)
-        self.is_downloading = False
+        if not self.parent.ready:
+            self.status_label.setVisible(True)
+            self.status_label.setText("Starting...")
+            self.parent.when_ready(self.start_download)
+            return
+        self.is_downloading = True
+        self.download_button.setEnabled(False)  # Disable the button while queued/running
+        if self.switch.isChecked():
+            start, end = self.from_input.text().strip(), self.to_input.text().strip()
+        else:
+            start, end = None, None
+        job = DownloadJob(
+            url,
+            self.folder_input.text(),
+            self.download_name_input.text().strip(),
+            self.quality_selector.currentText(),
+            start,
+            end,
+            fragments=self.parent.fragments,
+            clips=self.clips(),
+        )
+        self.job = job
+        job.on_progress = self.parent.report_progress
+        if is_playlist(url):
+            # Entries are queued as soon as they are listed, so the first
+            # downloads start while the rest of the playlist is still loading.
+            self.entries_failed = 0
+            self.expansion = PlaylistExpansion(job, lambda entry: self.parent.submit_job(self, entry),
+                                               on_listed=lambda expansion: self.parent.playlist_listed.emit(self))
+            self.update_playlist_state()
+            self.expansion.start()
+        else:
+            self.expansion = None
+            self.parent.submit_job(self, job)
 
+    def load_job(self, job):
+        """Fill the card's fields from a journaled job."""
+        self.url_input.setText(job.url)
+        self.folder_input.setText(job.folder)
+        self.download_name_input.setText(job.name)
+        self.quality_selector.setCurrentText(job.quality)
+        self.switch.setChecked(job.is_partial)
+        if job.is_partial:
+            self.from_input.setText(job.start)
+            self.to_input.setText(job.end)
+        self.clips_switch.setChecked(bool(job.clips))
+        self.clips_input.setPlainText("\n".join(" ".join(clip) for clip in job.clips))
+
+    def set_progress(self, event):
+        """Show a progress event from this card's job; runs on the GUI thread."""
+        label = {"download": "Downloading...", "trim": "Cutting...", "convert": "Converting..."}[event["stage"]]
+        if self.expansion is not None:
+            # The bar counts finished entries; the label shows the latest event.
+            self.status_label.setText(f"{self.playlist_status()} | {label} {format_event(event)}")
+            return
+        self.status_label.setText(f"{label} {format_event(event)}")
+        if event.get("percent") is not None:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(int(event["percent"]))
+
+    def set_job_state(self, state, detail=None):
+        """Reflect the scheduler state of this card's job; runs on the GUI thread."""
+        self.status_label.setVisible(True)
+        if state == QUEUED:
+            self.status_label.setText("Queued")
+        elif state == DOWNLOADING:
+            self.status_label.setText("Downloading...")
+            self.progress_bar.setVisible(True)
+            self.progress_bar.setRange(0, 0)  # Busy indicator until real progress exists
+        elif state == CONVERT_QUEUED:
+            self.status_label.setText("Waiting to convert...")
+        elif state == CONVERTING:
+            self.status_label.setText("Converting...")
+        else:
+            self.is_downloading = False
+            self.download_button.setEnabled(True)
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setVisible(False)
+            if state == FINISHED:
+                self.status_label.setText("Done")
+            elif state == FAILED:
+                self.status_label.setText(f"Failed ({self.job.failure or 'unknown'})")
+                print(detail)
+            elif state == CANCELLED:
+                self.status_label.setText("Cancelled")
+
+    def playlist_status(self):
+        expansion = self.expansion
+        status = f"Playlist: {expansion.done}/{expansion.listed} done"
+        if self.entries_failed:
+            status += f", {self.entries_failed} failed"
+        return status if expansion.listing_done else status + " (listing...)"
+
+    def set_entry_state(self, job, state, detail=None):
+        """Count a playlist entry's state change; runs on the GUI thread."""
+        if state == FAILED:
+            self.entries_failed += 1
+            print(detail)
+        if state in (FINISHED, FAILED, CANCELLED):
+            self.expansion.job_done(job)
+        self.update_playlist_state()
+
+    def update_playlist_state(self):
+        expansion = self.expansion
+        self.status_label.setVisible(True)
+        self.progress_bar.setVisible(True)
+        if not expansion.finished:
+            self.status_label.setText(self.playlist_status())
+            self.progress_bar.setRange(0, max(expansion.listed, 1))
+            self.progress_bar.setValue(expansion.done)
+            return
+        self.is_downloading = False
+        self.download_button.setEnabled(True)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        if expansion.error is not None and not expansion.listed:
+            self.status_label.setText("Failed to list playlist")
+        else:
+            self.status_label.setText(self.playlist_status().replace("Playlist:", "Playlist finished:"))
 
-    
     def delete_card(self):
+        # Stop this card's job (or all its playlist entries) without disturbing the other workers.
+        if self.expansion is not None:
+            self.expansion.cancel()
+        if self.job is not None:
+            self.job.cancel()
+        self.removed = True
         parent_layout = self.parent.scroll_layout
         parent_layout.removeWidget(self)
         
@@ -267,5 +566,16 @@ class Card(QFrame):
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = YouTubeTrimmer()
+    startup.mark("window")
     window.show()
+    # Runs once the event loop has painted the window; the slow imports and
+    # ffmpeg lookup then happen off the GUI thread. "startup_report" in
+    # settings.json appends the timings to that file as JSON lines.
+    def after_first_paint():
+        startup.mark("first paint")
+        def on_done():
+            startup.report(window.load_settings().get("startup_report"))
+            window.warmed_up.emit()
+        warm_up(startup, on_done=on_done)
+    QTimer.singleShot(0, after_first_paint)
     sys.exit(app.exec())
\ No newline at end of file
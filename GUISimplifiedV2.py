@@ -3,19 +3,15 @@ from PyQt6.QtWidgets import (
     QHBoxLayout, QLineEdit, QLabel, QCheckBox, QGridLayout, QComboBox, QFileDialog,
     QProgressBar
 )
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 import sys
 import os
 import json
-import yt_dlp
-import imageio_ffmpeg  # Ensures FFmpeg is available in the venv
 import re
-from utils.trimmer import trim_args
-from utils.conversion import Converter  
-from utils.formatparser import get_format_option
+from utils.jobs import DownloadJob
+from utils.engine import EngineThread
+from utils.scheduler import DOWNLOADING, CONVERTING, FINISHED, FAILED, CANCELLED
 
-vidConverter = Converter()
-ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
 SETTINGS_FILE = "settings.json"
 
 theme_styles = {
@@ -64,40 +60,19 @@ theme_styles = {
     """
 }
 
-# Worker thread for downloading
-class DownloadThread(QThread):
-    download_finished = pyqtSignal()
-    
-    def __init__(self, url, opts, parent=None):
-        super().__init__(parent)
-        self.url = url
-        self.opts = opts
-        
-    def run(self):
-        with yt_dlp.YoutubeDL(self.opts) as ydl:
-            ydl.download([self.url])
-        self.download_finished.emit()
-
-# Worker thread for conversion
-class ConversionThread(QThread):
-    conversion_finished = pyqtSignal()
-    
-    def __init__(self, input_base, output_filedir, output_fileName, deletesOriginal, parent=None):
-        super().__init__(parent)
-        self.input_base = input_base
-        self.output_filedir = output_filedir
-        self.output_fileName = output_fileName
-        self.deletesOriginal = deletesOriginal
-        
-    def run(self):
-        vidConverter.convert_webm_to_mp4(self.input_base, self.output_filedir, self.output_fileName, self.deletesOriginal)
-        self.conversion_finished.emit()
-
 class YouTubeTrimmer(QWidget):
+    # (job, state, detail) emitted from the engine's event loop thread
+    job_state = pyqtSignal(object, str, object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("YouTube Trimmer Tool")
         self.setGeometry(100, 100, 420, 250)
+
+        # The asyncio engine does the work; this window only follows its
+        # state changes. The downloaded original is replaced by the MP4.
+        self.job_state.connect(self.on_job_state)
+        self.engine = EngineThread(download_workers=1, on_state=self.job_state.emit, delete_original=True)
         
         self.last_selected_folder = self.load_last_selected_folder()
         self.current_theme = "dark"  # Default to dark theme
@@ -164,8 +139,20 @@ class YouTubeTrimmer(QWidget):
     def hide_download_overlay(self):
         self.download_overlay.hide()
     
+    def on_job_state(self, job, state, detail):
+        if job is not self.card.current_job:
+            return
+        if state == DOWNLOADING:
+            self.show_download_overlay("Downloading...")
+        elif state == CONVERTING:
+            self.show_download_overlay("Converting...")
+        elif state in (FINISHED, FAILED, CANCELLED):
+            if state == FAILED:
+                print(f"❌ Failed ({job.failure or 'unknown'})\n{detail}")
+            self.card.on_job_finished()
+
     def cancel_current_download(self):
-        # Call the card's cancel method to terminate any running thread.
+        # Call the card's cancel method to stop its job.
         self.card.cancel_download()
         self.hide_download_overlay()
 
@@ -174,8 +161,7 @@ class Card(QFrame):
         super().__init__(parent)
         self.setFrameShape(QFrame.Shape.Box)
         self.is_downloading = False
-        self.download_thread = None
-        self.conversion_thread = None
+        self.current_job = None
         layout = QVBoxLayout(self)
         
         # Top row: URL and folder selection
@@ -282,63 +268,39 @@ class Card(QFrame):
         self.is_downloading = True
 
         if self.switch.isChecked():
-            ffmpeg_args = trim_args(self.from_input.text(), self.to_input.text())
-        else:
-            ffmpeg_args = {}
-        download_name = self.download_name_input.text().strip() or "input"
-        if self.quality_selector.currentText() == "audio-only":
-            out_name = download_name if download_name.endswith(".wav") else download_name + ".wav"
+            start, end = self.from_input.text(), self.to_input.text()
         else:
-            out_name = download_name
-        opts = {
-            "outtmpl": os.path.join(self.folder_input.text(), out_name),
-            "external_downloader": ffmpeg_path,
-            "external_downloader_args": ffmpeg_args,
-            "format": get_format_option(self.quality_selector.currentText()),
-        }
-        url = self.url_input.text().strip()
-        
+            start, end = None, None
+        # Clips are cut by ffmpeg while downloading, audio-only goes to .wav.
+        job = DownloadJob(
+            self.url_input.text().strip(),
+            self.folder_input.text(),
+            self.download_name_input.text().strip() or "input",
+            self.quality_selector.currentText(),
+            start,
+            end,
+            trim_mode="reencode",
+            audio_format="wav",
+        )
+        self.current_job = job
+
         # Show the overlay from the main window with "Downloading..." text
         self.parent().show_download_overlay("Downloading...")
-        
-        # Create and start the download thread
-        self.download_thread = DownloadThread(url, opts)
-        self.download_thread.download_finished.connect(self.on_download_finished)
-        self.download_thread.start()
-    
-    def on_download_finished(self):
-        # If audio-only is selected, skip conversion.
-        if self.quality_selector.currentText() == "audio-only":
-            self.is_downloading = False
-            self.parent().hide_download_overlay()
-            return
+        self.parent().engine.submit(job)
 
-        self.parent().show_download_overlay("Converting...")
-        download_name = self.download_name_input.text().strip() or "input"
-        input_base = os.path.join(self.folder_input.text(), download_name)
-        output_fileName = download_name if download_name.endswith(".mp4") else download_name + ".mp4"
-        # Create and start the conversion thread.
-        self.conversion_thread = ConversionThread(input_base, self.folder_input.text(), output_fileName, deletesOriginal=True)
-        self.conversion_thread.conversion_finished.connect(self.on_conversion_finished)
-        self.conversion_thread.start()
-    
-    def on_conversion_finished(self):
+    def on_job_finished(self):
+        self.current_job = None
         self.is_downloading = False
         # Hide the overlay and reset overlay text
         self.parent().hide_download_overlay()
         self.parent().downloading_label.setText("Downloading...")
-    
+
     def cancel_download(self):
-        # If a download thread is running, terminate it.
-        if self.download_thread is not None and self.download_thread.isRunning():
-            self.download_thread.terminate()
-            self.download_thread.wait()
-            self.download_thread = None
-        # Also cancel conversion thread if running.
-        if hasattr(self, "conversion_thread") and self.conversion_thread is not None and self.conversion_thread.isRunning():
-            self.conversion_thread.terminate()
-            self.conversion_thread.wait()
-            self.conversion_thread = None
+        # The download aborts on its next progress hook (removing its partial
+        # files) and ffmpeg is terminated and reaped; the GUI never blocks here.
+        if self.current_job is not None:
+            self.parent().engine.cancel(self.current_job)
+            self.current_job = None
         self.is_downloading = False
         self.parent().hide_download_overlay()
 
@@ -1,410 +1,265 @@
-from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QPushButton, QFrame,
-    QHBoxLayout, QLineEdit, QLabel, QCheckBox, QComboBox, QFileDialog,
-)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QIcon
-import sys
-import ctypes
+import argparse
 import os
-import json
-import yt_dlp
-import traceback
-import imageio_ffmpeg  # Ensures FFmpeg is available in the venv
-import re
-from utils.trimmer import trim_args
-from utils.conversion import Converter  
-from utils.formatparser import get_format_option
+import sys
+import threading
+from collections import Counter
+from utils.jobs import (DownloadJob, TRIM_MODES, DEFAULT_FRAGMENTS, submit_job,
+                        enable_media_cache, enable_info_cache, enable_ydl_pool, enable_rate_limits,
+                        enable_metrics)
+from utils.manifest import load_manifest
+from utils.clips import load_clips
+from utils.ratelimit import parse_rate, parse_schedule
+from utils.failures import classify
+from utils.profiles import PROFILE_NAMES, DEFAULT_PROFILE
+from utils.audio import AUDIO_FORMATS
+from utils.journal import JobJournal, job_key
+from utils.playlist import PlaylistExpansion, is_playlist
+from utils.progress import JsonlProgressLog, fan_out
+from utils.engine import EngineThread
+from utils.scheduler import Pipeline, DOWNLOADING, CONVERTING, FINISHED, FAILED, CANCELLED
 
-vidConverter = Converter()
-ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
-SETTINGS_FILE = "settings.json"
+QUALITIES = ["4320p", "2160p", "1440p", "1080p", "720p", "480p", "360p", "240p", "144p", "audio-only"]
 
-theme_styles = {
-    "light": "",
-    "dark": """
-        QWidget {
-            background-color: #1E1E1E;
-            color: #D0D0D0;
-            font-size: 14px;
-        }
-        QPushButton {
-            background-color: #2D2D2D;
-            border: 2px solid #555;
-            border-radius: 6px;
-            color: #D0D0D0;
-            padding: 8px;
-        }
-        QPushButton:hover {
-            background-color: #3C3C3C;
-            border: 2px solid #777;
-        }
-        QLineEdit {
-            background-color: #252525;
-            border: 2px solid #555;
-            border-radius: 4px;
-            padding: 6px;
-            color: #D0D0D0;
-        }
-        QFrame {
-            background-color: #252525;
-            border: 2px solid #444;
-            border-radius: 10px;
-            padding: 12px;
-        }
-        QCheckBox::indicator {
-            width: 18px;
-            height: 18px;
-            border: 2px solid #D0D0D0;
-            background-color: #2A2A2A;
-            border-radius: 4px;
-        }
-        QCheckBox::indicator:checked {
-            background-color: #0078D7;
-            border: 2px solid #0078D7;
-        }
 
-    """
-}
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download YouTube videos in specified quality.")
+    parser.add_argument("url", nargs="?", help="YouTube video, playlist or channel URL")
+    parser.add_argument("directory", nargs="?", default=".", help="Pick directory to download the video into")
+    parser.add_argument("quality", nargs="?", default="1080p", choices=QUALITIES, help="Desired quality")
+    parser.add_argument("--start", help="Partial download Start time (HH:MM:SS)")
+    parser.add_argument("--end", help="Partial download End time (HH:MM:SS)")
+    parser.add_argument("--trim-mode", default="smart", choices=TRIM_MODES,
+                        help="smart: fetch and re-encode only what the clip needs; reencode: transcode the whole clip")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=PROFILE_NAMES,
+                        help="Encode profile; auto picks the x264 preset from measured speed")
+    parser.add_argument("--target-seconds", type=float, default=None,
+                        help="Turnaround time per encode for --profile auto (default: 60)")
+    parser.add_argument("--audio-format", choices=tuple(AUDIO_FORMATS), default=None,
+                        help="Output of audio-only jobs; m4a/opus copy the stream, mp3/flac/wav transcode "
+                             "(default: from --name's extension, else m4a)")
+    parser.add_argument("--name", default="input", help="Download under name (single URL mode)")
+    parser.add_argument("--clips", help="File with one 'start end name' clip per line; the video is fetched "
+                                        "once under --name and every clip is cut from it (single URL mode)")
+    parser.add_argument("--manifest", help="CSV/JSONL file with url,name,quality,start,end rows")
+    parser.add_argument("--jobs", type=int, default=3, help="Number of concurrent downloads")
+    parser.add_argument("--convert-jobs", type=int, default=None,
+                        help="Number of concurrent conversions (default: one per core)")
+    parser.add_argument("--fragments", type=int, default=DEFAULT_FRAGMENTS,
+                        help="Fragments of a DASH/HLS stream to fetch in parallel per job (default: %(default)s)")
+    parser.add_argument("--max-connections", type=int, default=16,
+                        help="Connections shared by all running downloads (default: %(default)s)")
+    parser.add_argument("--limit-rate", help="Bandwidth shared by all downloads, e.g. 500K or 4M (bytes/s)")
+    parser.add_argument("--limit-schedule", action="append", default=[], metavar="HH:MM-HH:MM=RATE",
+                        help="Bandwidth for a time of day, e.g. 09:00-18:00=1M; overrides --limit-rate "
+                             "inside the window (repeatable)")
+    parser.add_argument("--host-connections", type=int, default=None,
+                        help="Connections all jobs of one site may hold together")
+    parser.add_argument("--host-requests", type=float, default=None,
+                        help="Requests per second sent to one site (page loads and fragments)")
+    parser.add_argument("--cache-dir", help="Keep fetched sources in this directory and reuse them")
+    parser.add_argument("--cache-size", type=float, default=5,
+                        help="Media cache size limit in GiB (default: 5)")
+    parser.add_argument("--info-cache", help="SQLite file for reusing extracted video info between runs")
+    parser.add_argument("--info-ttl", type=int, default=None,
+                        help="Seconds an extracted info entry stays fresh (default: 1800)")
+    parser.add_argument("--engine", default="threads", choices=("threads", "asyncio"),
+                        help="threads: worker pool per stage; asyncio: one event loop runs every job, "
+                             "ffmpeg as async subprocesses (default: %(default)s)")
+    parser.add_argument("--no-ydl-pool", action="store_true",
+                        help="Build a fresh YoutubeDL per job instead of reusing one per worker")
+    parser.add_argument("--journal", help="SQLite job journal; finished jobs are skipped on the next run")
+    parser.add_argument("--resume", action="store_true",
+                        help="Also re-run the jobs the journal saw queued or running when the last run stopped")
+    parser.add_argument("--progress-log", help="Append JSON-lines progress events (speed, ETA, fps) to this file")
+    parser.add_argument("--metrics", help="Append JSON-lines timing spans of every job stage to this file")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve the metrics in Prometheus text format on this localhost port")
+    args = parser.parse_args(argv)
+    if args.resume and not args.journal:
+        parser.error("--resume needs --journal")
+    if not args.url and not args.manifest and not args.resume:
+        parser.error("either a url, --manifest or --resume is required")
+    if bool(args.start) != bool(args.end):
+        parser.error("--start and --end must be given together")
+    if args.clips and (args.start or args.manifest or not args.url):
+        parser.error("--clips needs a url and cannot be combined with --start/--end or --manifest")
+    try:
+        args.clip_list = load_clips(args.clips) if args.clips else None
+    except (OSError, ValueError) as e:
+        parser.error(f"--clips: {e}")
+    try:
+        args.manifest_jobs = load_manifest(args.manifest, args.directory, args.quality) if args.manifest else None
+    except (OSError, ValueError) as e:
+        parser.error(f"--manifest: {e}")
+    try:
+        args.limit_rate = parse_rate(args.limit_rate)
+        args.limit_schedule = parse_schedule(args.limit_schedule)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
 
 
-def dump_all_files(error_message, folder, ui_state=""):
-    error_log = "error.txt"
-    try:
-        with open(error_log, "w", encoding="utf-8") as f:
-            f.write("Error occurred:\n")
-            f.write(error_message + "\n\n")
-            f.write("UI State:\n" + ui_state + "\n\n")
-            f.write("Dumping files in folder: " + folder + "\n")
-            for file in os.listdir(folder):
-                f.write(file + "\n")
-    except Exception as e:
-        print("Failed to dump error info:", e)
+def build_jobs(args):
+    if args.manifest:
+        jobs = args.manifest_jobs
+    elif args.url:
+        jobs = [DownloadJob(args.url, args.directory, args.name, args.quality, args.start, args.end,
+                            audio_format=args.audio_format, clips=args.clip_list)]
+    else:
+        jobs = []
+    for job in jobs:
+        job.trim_mode = args.trim_mode
+        job.profile = args.profile
+        job.target_seconds = args.target_seconds
+        job.fragments = args.fragments
+    return jobs
 
 
-# Worker thread for downloading
-class DownloadThread(QThread):
-    download_finished = pyqtSignal()
-    
-    def __init__(self, url, opts, ui_state="", parent=None):
-        super().__init__(parent)
-        self.url = url
-        self.opts = opts
-        self.ui_state = ui_state
-        
-    def run(self):
-        try:
-            with yt_dlp.YoutubeDL(self.opts) as ydl:
-                ydl.download([self.url])
-        except Exception as e:
-            dump_all_files(traceback.format_exc(), ".", self.ui_state)
-        self.download_finished.emit()
+def resume_jobs(journal, jobs, resume=False):
+    """Drop jobs the journal saw finish and, with resume, add interrupted ones."""
+    if resume:
+        keys = {job_key(job) for job in jobs}
+        for job, partial_files in journal.unfinished():
+            if job_key(job) not in keys:
+                jobs.append(job)
+                print(f"↩️ Resuming {job.output_name} ({len(partial_files)} partial file(s))")
+    remaining = []
+    for job in jobs:
+        if journal.is_finished(job):
+            print(f"⏭️ Already done {job.output_name}")
+        else:
+            remaining.append(job)
+    return remaining
 
-# Worker thread for conversion
-class ConversionThread(QThread):
-    conversion_finished = pyqtSignal()
-    
-    def __init__(self, input_base, output_filedir, output_fileName, deletesOriginal, ui_state="", parent=None):
-        super().__init__(parent)
-        self.input_base = input_base
-        self.output_filedir = output_filedir
-        self.output_fileName = output_fileName
-        self.deletesOriginal = deletesOriginal
-        self.ui_state = ui_state
-        
-    def run(self):
-        try:
-            vidConverter.convert_webm_to_mp4(self.input_base, self.output_filedir, self.output_fileName, self.deletesOriginal)
-        except Exception as e:
-            dump_all_files(traceback.format_exc(), ".", self.ui_state)
-        self.conversion_finished.emit()
 
+def run(jobs, download_workers, convert_workers=None, on_progress=None, max_connections=16, journal=None,
+        engine="threads", metrics=None):
+    """Run jobs through the pipeline; return (failed jobs, number of jobs run).
 
+    A job whose URL is a playlist or channel is expanded on a background
+    thread and every entry is queued as soon as it is listed. engine
+    "asyncio" runs the jobs on utils.engine's event loop instead of the
+    thread pools of utils.scheduler.Pipeline.
+    metrics (utils.metrics.Metrics) counts how every job ended.
+    """
+    failed = []
+    total = [0]
+    lock = threading.Lock()
+    expansions = []
 
-class YouTubeTrimmer(QWidget):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("GQIA YouTube Trimmer Tool")
-        self.setGeometry(100, 100, 420, 250)
-        
-        self.last_selected_folder = self.load_last_selected_folder()
-        self.current_theme = "dark"  # Default to dark theme
-        self.setStyleSheet(theme_styles[self.current_theme])
-        
-        self.layout = QVBoxLayout(self)
-        
-        self.card = Card(self, self.last_selected_folder)
-        self.card.setStyleSheet(theme_styles[self.current_theme])
-        self.layout.addWidget(self.card)
-        
-        self.theme_switcher = QPushButton("Toggle Theme")
-        self.theme_switcher.clicked.connect(self.toggle_theme)
-        self.layout.addWidget(self.theme_switcher)
-        
-        self.setLayout(self.layout)
-        
-        # Create an overlay widget to indicate downloading in progress
-        self.download_overlay = QWidget(self)
-        self.download_overlay.setStyleSheet("background-color: rgba(0, 0, 0, 0.7);")
-        self.download_overlay.setGeometry(0, 0, self.width(), self.height())
-        overlay_layout = QVBoxLayout(self.download_overlay)
-        overlay_layout.addStretch()
-        self.downloading_label = QLabel("Downloading...", self.download_overlay)
-        self.downloading_label.setStyleSheet("font-size: 20px; color: white;")
-        self.downloading_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        overlay_layout.addWidget(self.downloading_label)
-        overlay_layout.addStretch()
-         # Add a cancel button to the overlay.
-        self.cancel_button = QPushButton("Cancel", self.download_overlay)
-        self.cancel_button.setStyleSheet("font-size: 16px; padding: 6px;")
-        self.cancel_button.clicked.connect(self.cancel_current_download)
-        overlay_layout.addWidget(self.cancel_button, alignment=Qt.AlignmentFlag.AlignCenter)
-        self.download_overlay.hide()
-    
-    def resizeEvent(self, event):
-        super().resizeEvent(event)
-        self.download_overlay.setGeometry(0, 0, self.width(), self.height())
-    
-    def load_last_selected_folder(self):
-        if os.path.exists(SETTINGS_FILE):
-            try:
-                with open(SETTINGS_FILE, "r") as file:
-                    settings = json.load(file)
-                    return settings.get("last_selected_folder", os.path.expanduser("~/Downloads"))
-            except (json.JSONDecodeError, FileNotFoundError):
-                pass
-        return os.path.expanduser("~/Downloads")
-    
-    def save_last_selected_folder(self, folder):
-        settings = {"last_selected_folder": folder}
-        with open(SETTINGS_FILE, "w") as file:
-            json.dump(settings, file)
-    
-    def toggle_theme(self):
-        self.current_theme = "dark" if self.current_theme == "light" else "light"
-        self.setStyleSheet(theme_styles[self.current_theme])
-        self.card.setStyleSheet(theme_styles[self.current_theme])
+    def on_state(job, state, detail):
+        with lock:
+            if state == DOWNLOADING:
+                print(f"⬇️ Downloading {job.output_name}")
+            elif state == CONVERTING:
+                print(f"🔧 Converting {job.output_name}")
+            elif state == FINISHED:
+                print(f"✅ Done {job.output_name}")
+            elif state == CANCELLED:
+                print(f"🛑 Cancelled {job.output_name}")
+            elif state == FAILED:
+                failed.append(job)
+                print(f"❌ Failed {job.output_name} ({job.failure or 'unknown'})\n{detail}", file=sys.stderr)
+        if state in (FINISHED, FAILED, CANCELLED):
+            for expansion in expansions:
+                expansion.job_done(job)
 
-    def show_download_overlay(self, text="Downloading..."):
-        self.downloading_label.setText(text)
-        self.download_overlay.show()
-    
-    def hide_download_overlay(self):
-        self.download_overlay.hide()
-    
-    def cancel_current_download(self):
-        # Call the card's cancel method to terminate any running thread.
-        self.card.cancel_download()
-        self.hide_download_overlay()
+    if metrics is not None:
+        on_state = metrics.tracking(on_state)
+    if journal is not None:
+        on_state = journal.tracking(on_state)
+        on_progress = fan_out(on_progress, journal.progress)
+    if engine == "asyncio":
+        pipeline = EngineThread(download_workers, convert_workers, on_state=on_state, max_connections=max_connections)
+    else:
+        pipeline = Pipeline(download_workers, convert_workers, on_state=on_state, max_connections=max_connections)
 
-class Card(QFrame):
-    def __init__(self, parent=None, default_folder=""):
-        super().__init__(parent)
-        self.setFrameShape(QFrame.Shape.Box)
-        self.is_downloading = False
-        layout = QVBoxLayout(self)
-        
-        # Top row: URL and folder selection
-        top_layout = QHBoxLayout()
-        self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText("Paste YouTube link here...")
-        
-        self.folder_input = QLineEdit()
-        self.folder_input.setPlaceholderText("Selected folder...")
-        self.folder_input.setReadOnly(True)
-        self.folder_input.setText(default_folder)
-        
-        self.folder_button = QPushButton("Select Folder")
-        self.folder_button.clicked.connect(self.open_folder_dialog)
-        
-        top_layout.addWidget(self.url_input)
-        top_layout.addWidget(self.folder_input)
-        top_layout.addWidget(self.folder_button)
-        
-        # Additional fields: quality and download name
-        self.quality_selector = QComboBox()
-        self.quality_selector.addItems(["4320p", "2160p", "1440p","1080p", "720p", "480p", "360p", "240p", "144p", "audio-only"])
-        
-        self.download_name_input = QLineEdit()
-        self.download_name_input.setPlaceholderText("Download under name:")
-        
-        # Partial download option with from/to fields
-        self.switch = QCheckBox("Partial")
-        self.switch.stateChanged.connect(self.toggle_partial_fields)
-        
-        self.from_input = QLineEdit()
-        self.from_input.setPlaceholderText("From (hh:mm:ss)")
-        self.from_input.setVisible(False)
-        
-        self.to_input = QLineEdit()
-        self.to_input.setPlaceholderText("To (hh:mm:ss)")
-        self.to_input.setVisible(False)
-        
-        self.download_button = QPushButton("Download")
-        self.download_button.setVisible(False)
-        self.download_button.clicked.connect(self.start_download)
-        
-        
-        # Add widgets to layout
-        layout.addLayout(top_layout)
-        layout.addWidget(self.quality_selector)
-        layout.addWidget(self.download_name_input)
-        layout.addWidget(self.switch)
-        layout.addWidget(self.from_input)
-        layout.addWidget(self.to_input)
-        layout.addWidget(self.download_button)
-        
-        # Connect changes to update button visibility
-        self.url_input.textChanged.connect(self.update_download_button)
-        self.switch.stateChanged.connect(self.update_download_button)
-        self.from_input.textChanged.connect(self.update_download_button)
-        self.to_input.textChanged.connect(self.update_download_button)
-        self.download_name_input.textChanged.connect(self.update_download_button)
-    
-    def open_folder_dialog(self):      
-        start_dir = self.folder_input.text().strip() or os.path.expanduser("~/Downloads")
-        
-        folder_path = QFileDialog.getExistingDirectory(
-            self,
-            "Select Folder",
-            start_dir,
-            QFileDialog.Option.ShowDirsOnly
-        )
-        if folder_path:
-            self.folder_input.setText(folder_path)
-            # Update the main window's last folder and save it
-            self.parent().last_selected_folder = folder_path
-            self.parent().save_last_selected_folder(folder_path)
-    
-    def toggle_partial_fields(self):
-        checked = self.switch.isChecked()
-        self.from_input.setVisible(checked)
-        self.to_input.setVisible(checked)
-        self.update_download_button()
-    
-    def is_valid_time_format(self, time_str):
-        """Check if time_str is in hh:mm:ss or mm:ss format."""
-        return bool(re.fullmatch(r'(\d{1,2}:)?\d{1,2}:\d{2}', time_str))
-    
-    def convert_to_seconds(self, time_str):
-        """Convert hh:mm:ss or mm:ss to total seconds for comparison."""
-        parts = list(map(int, time_str.split(":")))
-        if len(parts) == 3:
-            return parts[0] * 3600 + parts[1] * 60 + parts[2]
-        elif len(parts) == 2:
-            return parts[0] * 60 + parts[1]
-        return 0
-    
-    def get_ui_state(self):
-        """Return a string with the current UI field values."""
-        state = []
-        state.append("URL: " + self.url_input.text())
-        state.append("Folder: " + self.folder_input.text())
-        state.append("Download Name: " + self.download_name_input.text())
-        state.append("Quality: " + self.quality_selector.currentText())
-        state.append("Partial: " + str(self.switch.isChecked()))
-        if self.switch.isChecked():
-            state.append("From: " + self.from_input.text())
-            state.append("To: " + self.to_input.text())
-        return "\n".join(state)
-    
-    def update_download_button(self):
-        url_valid = bool(self.url_input.text().strip())
-        folder_valid = bool(self.folder_input.text().strip())
-        download_name_valid = bool(self.download_name_input.text().strip())
-        if self.switch.isChecked():
-            from_text = self.from_input.text().strip()
-            to_text = self.to_input.text().strip()
-            from_valid = self.is_valid_time_format(from_text)
-            to_valid = self.is_valid_time_format(to_text)
-            # Ensure "To" is after "From"
-            time_valid = from_valid and to_valid and self.convert_to_seconds(to_text) > self.convert_to_seconds(from_text)
-            self.download_button.setVisible(url_valid and folder_valid and download_name_valid and time_valid)
-        else:
-            self.download_button.setVisible(url_valid and folder_valid and download_name_valid)
-    
-    def start_download(self):
-        if self.is_downloading:
+    def submit(job):
+        if journal is not None and journal.is_finished(job):
+            print(f"⏭️ Already done {job.output_name}")
             return
-        self.is_downloading = True
-
-        
-        # Use the download name from the input field (default to "input" if empty)
-        download_name = self.download_name_input.text().strip() or "input"
-        if self.quality_selector.currentText() == "audio-only":
-            # Ensure the output name ends with .wav for audio-only downloads
-            out_name = download_name if download_name.endswith(".wav") else download_name + ".wav"
+        with lock:
+            total[0] += 1
+        job.on_progress = on_progress
+        if engine == "asyncio":
+            pipeline.submit(job)
         else:
-            out_name = download_name if download_name.lower().endswith(".mp4") else download_name + ".mp4"
+            submit_job(pipeline, job)
 
-        if self.switch.isChecked():
-            global ffmpeg_path
-            ffmpeg_args = trim_args(self.from_input.text().strip(), self.to_input.text().strip())
-            opts = {
-            "outtmpl": os.path.join(self.folder_input.text(), out_name),
-            "external_downloader": ffmpeg_path,
-            "external_downloader_args": ffmpeg_args,
-            "format":  get_format_option(self.quality_selector.currentText()),
-            "merge_output_format": "mp4",
-        }
+    for job in jobs:
+        if is_playlist(job.url):
+            print(f"📃 Listing playlist {job.url}")
+            expansions.append(PlaylistExpansion(job, submit).start())
         else:
-            opts = {
-                "outtmpl": os.path.join(self.folder_input.text(), out_name),
-                "format":  get_format_option(self.quality_selector.currentText()),
-                "merge_output_format": "mp4",
-            }
-        #opts["cookiefile"] = "cookies.txt"
+            submit(job)
+    try:
+        # Entries are still being queued until every listing is complete.
+        for expansion in expansions:
+            expansion.join()
+            print(f"📃 Listed {expansion.listed} entries of {expansion.template.url}")
+            if expansion.error is not None:
+                with lock:
+                    total[0] += 1
+                    expansion.template.failure = classify(expansion.error)
+                    failed.append(expansion.template)
+        pipeline.join()
+    except KeyboardInterrupt:
+        # Ctrl-C: stop every job cleanly (ffmpeg reaped, partial files removed).
+        print("🛑 Cancelling all jobs...", file=sys.stderr)
+        for expansion in expansions:
+            expansion.cancel()
+        for job in jobs:
+            job.cancel()
+        pipeline.join()
+        raise
+    finally:
+        if engine == "asyncio":
+            pipeline.close()
+    return failed, total[0]
 
-        url = self.url_input.text().strip()
-        
-        ui_state = self.get_ui_state()
-        # Show the overlay from the parent (main window)
-        self.parent().show_download_overlay()
-        
-        # Create and start the download thread
-        self.download_thread = DownloadThread(url, opts,ui_state, parent=self)
-        self.download_thread.download_finished.connect(self.on_download_finished)
-        self.download_thread.start()
-    
-    def on_download_finished(self):
-        download_name = self.download_name_input.text().strip() or "input"
-        # If the download name already ends with .mp3 or .wav, skip conversion.
-        if self.quality_selector.currentText() == "audio-only":
-            self.parent().hide_download_overlay()
-            self.is_downloading = False
-            return
-        self.parent().show_download_overlay("Converting...")
-        input_base = os.path.join(self.folder_input.text(), download_name)
-        output_fileName = download_name if download_name.endswith(".mp4") else download_name + ".mp4"
-        # Create and start the conversion thread.
-        self.conversion_thread = ConversionThread(input_base, self.folder_input.text(), output_fileName, deletesOriginal=False)
-        self.conversion_thread.conversion_finished.connect(self.on_conversion_finished)
-        self.conversion_thread.start()
 
-    def on_conversion_finished(self):
-        self.is_downloading = False
-        # Hide the overlay and reset overlay text
-        self.parent().hide_download_overlay()
-        self.parent().downloading_label.setText("Downloading...")
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = build_jobs(args)
+    journal = JobJournal(args.journal) if args.journal else None
+    if journal is not None:
+        jobs = resume_jobs(journal, jobs, args.resume)
+    for folder in {job.folder for job in jobs}:
+        os.makedirs(folder, exist_ok=True)
+    cache = enable_media_cache(args.cache_dir, int(args.cache_size * 1024 ** 3)) if args.cache_dir else None
+    infos = enable_info_cache(args.info_cache, args.info_ttl) if args.info_cache else None
+    ydls = None if args.no_ydl_pool else enable_ydl_pool()
+    if args.limit_rate or args.limit_schedule or args.host_connections or args.host_requests:
+        enable_rate_limits(args.limit_rate, args.limit_schedule, args.host_connections, args.host_requests)
+    metrics = enable_metrics(args.metrics, args.metrics_port) if args.metrics or args.metrics_port else None
+    progress_log = JsonlProgressLog(args.progress_log) if args.progress_log else None
+    try:
+        failed, total = run(jobs, args.jobs, args.convert_jobs, progress_log, args.max_connections, journal,
+                            args.engine, metrics)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if progress_log is not None:
+            progress_log.close()
+        if ydls is not None:
+            ydls.close()
+        if metrics is not None:
+            metrics.close()
+    print(f"{total - len(failed)}/{total} jobs succeeded")
+    if failed:
+        reasons = Counter(job.failure or "unknown" for job in failed)
+        print("Failures: " + ", ".join(f"{count} {failure}" for failure, count in reasons.most_common()))
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Media cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} files")
+    if infos is not None:
+        stats = infos.stats()
+        print(f"Info cache: {stats['hits']} hits, {stats['misses']} misses")
+    if ydls is not None:
+        stats = ydls.stats()
+        print(f"YoutubeDL pool: {stats['created']} created, {stats['reused']} reused")
+    return 1 if failed else 0
 
-    def cancel_download(self):
-        # If a download thread is running, terminate it.
-        if self.download_thread is not None and self.download_thread.isRunning():
-            self.download_thread.terminate()
-            self.download_thread.wait()
-            self.download_thread = None
-        # Also cancel conversion thread if running.
-        if hasattr(self, "conversion_thread") and self.conversion_thread is not None and self.conversion_thread.isRunning():
-            self.conversion_thread.terminate()
-            self.conversion_thread.wait()
-            self.conversion_thread = None
-        self.is_downloading = False
-        self.parent().hide_download_overlay()
 
 if __name__ == "__main__":
-    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("mycompany.myapp")
-    app = QApplication(sys.argv)
-    app.setWindowIcon(QIcon("yttrimmerIcon.ico"))  # Set the app icon
-    window = YouTubeTrimmer()
-    window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(main())
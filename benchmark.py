@@ -0,0 +1,332 @@
+"""Reproducible benchmarks for downloading, trimming and converting.
+
+Synthetic videos are generated with the bundled ffmpeg and served from a
+local HTTP server (with byte-range support, like a real CDN), as a plain
+MP4 plus HLS and DASH variants that yt-dlp's generic extractor reads. Each
+scenario runs through the same code the front-ends use (DownloadJob,
+Pipeline, Converter) and the timings are written to JSON. Pass an earlier
+result file with --baseline to fail on regressions.
+
+    python benchmark.py --resolutions 360 720 1080 --concurrency 1 4 --output bench.json
+"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import yt_dlp
+from utils.binaries import ffmpeg_path
+from utils.conversion import Converter
+from utils.jobs import DownloadJob, download
+from utils.profiles import DEFAULT_PROFILE, PROFILE_NAMES
+from utils.scheduler import Pipeline, FAILED
+
+SCENARIOS = ("download", "trim", "convert")
+# Delivery variants of every fixture; hls/dash are fetched fragment by fragment.
+VARIANTS = ("progressive", "hls", "dash")
+TRIM_MODES = ("smart", "reencode")
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler that also answers single "Range: bytes=" requests.
+
+    ffmpeg seeks in http inputs with range requests, so without them a clip
+    would read the file from the start and the trim numbers would be wrong.
+    """
+
+    def log_message(self, format, *args):
+        pass  # Keep the benchmark output readable
+
+    def end_headers(self):
+        if getattr(self, "_range_length", None) is None:
+            self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def send_head(self):
+        self._range_length = None
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", (self.headers.get("Range") or "").strip())
+        path = self.translate_path(self.path)
+        if match is None or not any(match.groups()) or not os.path.isfile(path):
+            return super().send_head()
+        file = open(path, "rb")
+        size = os.fstat(file.fileno()).st_size
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+        else:
+            start, end = max(0, size - int(last)), size - 1
+        if start >= size or start > end:
+            file.close()
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return None
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self._range_length = end - start + 1
+        self.end_headers()
+        file.seek(start)
+        return file
+
+    def copyfile(self, source, outputfile):
+        remaining = self._range_length
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+def serve(directory):
+    """Serve directory on a free localhost port; returns (server, base_url)."""
+    handler = functools.partial(RangeRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _ffmpeg(*args):
+    subprocess.run([ffmpeg_path(), "-hide_banner", "-loglevel", "error", "-y", *args], check=True)
+
+
+def make_fixtures(directory, height, seconds):
+    """Generate the test media for one resolution and return their paths.
+
+    "progressive" is H.264/AAC MP4 (remuxed by the converter), "transcode"
+    an MPEG-4 Part 2 MKV the converter has to re-encode, and "hls"/"dash"
+    are the MP4 cut into 4 second fMP4 fragments.
+    """
+    width = height * 16 // 9 // 2 * 2
+    base = os.path.join(directory, f"{height}p")
+    sources = ["-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30",
+               "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000", "-t", str(seconds)]
+    fixtures = {"progressive": base + ".mp4", "transcode": base + ".mkv",
+                "hls": os.path.join(base + "-hls", "index.m3u8"),
+                "dash": os.path.join(base + "-dash", "manifest.mpd")}
+    if all(os.path.exists(path) for path in fixtures.values()):
+        return fixtures
+    _ffmpeg(*sources, "-c:v", "libx264", "-preset", "veryfast", "-g", "60", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", fixtures["progressive"])
+    _ffmpeg(*sources, "-c:v", "mpeg4", "-q:v", "4", "-c:a", "aac", "-b:a", "128k", fixtures["transcode"])
+    os.makedirs(base + "-hls", exist_ok=True)
+    _ffmpeg("-i", fixtures["progressive"], "-c", "copy", "-f", "hls", "-hls_time", "4",
+            "-hls_playlist_type", "vod", "-hls_segment_type", "fmp4",
+            "-hls_segment_filename", os.path.join(base + "-hls", "seg%03d.m4s"), fixtures["hls"])
+    os.makedirs(base + "-dash", exist_ok=True)
+    _ffmpeg("-i", fixtures["progressive"], "-c", "copy", "-f", "dash", "-seg_duration", "4",
+            "-use_template", "1", "-use_timeline", "1", fixtures["dash"])
+    return fixtures
+
+
+def _run_pipeline(jobs, download_workers):
+    """Download jobs through a Pipeline and return the wall time in seconds."""
+    failures = []
+
+    def on_state(key, state, detail):
+        if state == FAILED:
+            failures.append(detail)
+
+    pipeline = Pipeline(download_workers, on_state=on_state)
+    started = time.perf_counter()
+    for job in jobs:
+        pipeline.submit(job, lambda job=job: download(job, pipeline.connections))
+    pipeline.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise RuntimeError("benchmark job failed:\n" + failures[0])
+    return elapsed
+
+
+def _output_bytes(jobs):
+    return sum(os.path.getsize(job.downloaded_file) for job in jobs if job.downloaded_file)
+
+
+def bench_download(url, folder, concurrency):
+    jobs = [DownloadJob(url, folder, f"download-{i}", "1080p") for i in range(concurrency)]
+    seconds = _run_pipeline(jobs, concurrency)
+    return seconds, {"bytes": _output_bytes(jobs)}
+
+
+def bench_trim(url, folder, concurrency, seconds, trim_mode, profile):
+    # The middle half of the video, so both cut points fall mid-GOP.
+    start, end = f"{seconds * 0.25:.3f}", f"{seconds * 0.75:.3f}"
+    jobs = [DownloadJob(url, folder, f"clip-{i}", "1080p", start, end, trim_mode, profile)
+            for i in range(concurrency)]
+    elapsed = _run_pipeline(jobs, concurrency)
+    return elapsed, {"bytes": _output_bytes(jobs), "trim_mode": trim_mode}
+
+
+def bench_convert(source, folder, concurrency, profile):
+    """Transcode concurrency copies of source at once through the conversion pool."""
+    failures = []
+
+    def on_state(key, state, detail):
+        if state == FAILED:
+            failures.append(detail)
+
+    pipeline = Pipeline(1, concurrency, on_state=on_state)
+    inputs = []
+    for i in range(concurrency):
+        inputs.append(os.path.join(folder, f"convert-{i}{os.path.splitext(source)[1]}"))
+        shutil.copyfile(source, inputs[-1])
+    converter = Converter()
+
+    def convert(path, i):
+        # convert_webm_to_mp4 reports failures by returning None.
+        mode = converter.convert_webm_to_mp4(path, folder, f"convert-{i}.mp4", False, profile,
+                                             threads=pipeline.conversion_threads())
+        if mode is None:
+            raise RuntimeError("Conversion failed for " + path)
+        return mode
+
+    started = time.perf_counter()
+    for i, path in enumerate(inputs):
+        pipeline.submit(i, lambda: None, lambda path=path, i=i: convert(path, i))
+    pipeline.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise RuntimeError("benchmark conversion failed:\n" + failures[0])
+    return elapsed, {"files_per_hour": concurrency * 3600 / elapsed, "profile": profile}
+
+
+def run_benchmarks(args):
+    results = []
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ytbench-")
+    fixture_dir = os.path.join(workdir, "fixtures")
+    os.makedirs(fixture_dir, exist_ok=True)
+    server, base_url = serve(fixture_dir)
+    try:
+        for height in args.resolutions:
+            print(f"🎞️ Generating {height}p fixtures ({args.seconds}s)")
+            fixtures = make_fixtures(fixture_dir, height, args.seconds)
+            cases = []
+            for concurrency in args.concurrency:
+                if "download" in args.only:
+                    for variant in VARIANTS:
+                        url = base_url + "/" + os.path.relpath(fixtures[variant], fixture_dir).replace(os.sep, "/")
+                        cases.append(("download", variant, concurrency,
+                                      lambda folder, url=url, c=concurrency: bench_download(url, folder, c)))
+                if "trim" in args.only:
+                    url = base_url + "/" + os.path.basename(fixtures["progressive"])
+                    for trim_mode in TRIM_MODES:
+                        cases.append(("trim", trim_mode, concurrency,
+                                      lambda folder, url=url, c=concurrency, m=trim_mode:
+                                      bench_trim(url, folder, c, args.seconds, m, args.profile)))
+                if "convert" in args.only:
+                    cases.append(("convert", "transcode", concurrency,
+                                  lambda folder, c=concurrency: bench_convert(fixtures["transcode"], folder, c,
+                                                                              args.profile)))
+            for scenario, variant, concurrency, case in cases:
+                runs = []
+                extra = {}
+                result = {"scenario": scenario, "variant": variant, "height": height, "concurrency": concurrency}
+                try:
+                    for _ in range(args.repeat):
+                        folder = tempfile.mkdtemp(prefix="run-", dir=workdir)
+                        try:
+                            seconds, extra = case(folder)
+                        finally:
+                            shutil.rmtree(folder, ignore_errors=True)
+                        runs.append(seconds)
+                except Exception as e:
+                    # One broken case should not cost the results of all the others.
+                    result.update(failed=True, error=str(e), runs=runs)
+                    results.append(result)
+                    print(f"❌ {scenario}/{variant} {height}p x{concurrency} failed: {e}", file=sys.stderr)
+                    continue
+                result.update(seconds=statistics.median(runs), runs=runs)
+                result.update(extra)
+                if result.get("bytes"):
+                    result["mib_per_s"] = result["bytes"] / 2**20 / result["seconds"]
+                results.append(result)
+                print(f"⏱️ {scenario}/{variant} {height}p x{concurrency}: {result['seconds']:.2f}s")
+    finally:
+        server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def environment():
+    version = subprocess.run([ffmpeg_path(), "-version"], stdout=subprocess.PIPE, text=True).stdout.split("\n")[0]
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": version,
+        "yt_dlp": yt_dlp.version.__version__,
+    }
+
+
+def _case_key(result):
+    return result["scenario"], result["variant"], result["height"], result["concurrency"]
+
+
+def find_regressions(results, baseline, tolerance):
+    """Results slower than the matching baseline entry by more than tolerance."""
+    previous = {_case_key(r): r for r in baseline.get("results", []) if not r.get("failed")}
+    regressions = []
+    for result in results:
+        old = previous.get(_case_key(result))
+        if old and not result.get("failed") and result["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append((result, old))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark download, trim and convert against local fixtures.")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[360, 720, 1080],
+                        help="Fixture heights to generate (default: 360 720 1080)")
+    parser.add_argument("--seconds", type=int, default=20, help="Fixture length in seconds (default: 20)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4],
+                        help="Jobs run at once per case (default: 1 4)")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="Scenarios to run (default: all)")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE,
+                        help="Encode profile for trims and conversions")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median is reported")
+    parser.add_argument("--workdir", help="Keep fixtures here (reused between runs) instead of a temp dir")
+    parser.add_argument("--output", default="benchmark.json", help="Result file (default: benchmark.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown against --baseline before failing (default: 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({"environment": environment(), "results": results}, file, indent=2)
+    print(f"📝 Wrote {len(results)} results to {args.output}")
+    failed = [result for result in results if result.get("failed")]
+    if failed:
+        print(f"❌ {len(failed)} case(s) failed", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for result, old in regressions:
+            print(f"❌ Regression {'/'.join(map(str, _case_key(result)))}: "
+                  f"{old['seconds']:.2f}s -> {result['seconds']:.2f}s", file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
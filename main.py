@@ -1,23 +1,25 @@
+from utils.startup import StartupTimer, warm_up
+startup = StartupTimer()  # Before the Qt imports, to time them too
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QFrame,
     QHBoxLayout, QLineEdit, QLabel, QCheckBox, QComboBox, QFileDialog,
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QIcon
 import sys
 import ctypes
 import os
 import json
-import yt_dlp
-import traceback
-import imageio_ffmpeg  # Ensures FFmpeg is available in the venv
 import re
-from utils.trimmer import trim_args
-from utils.conversion import Converter  
-from utils.formatparser import get_format_option
+import time
+from utils.jobs import (DownloadJob, DEFAULT_FRAGMENTS, submit_job, enable_media_cache,
+                        enable_info_cache, enable_ydl_pool, enable_rate_limits)
+from utils.playlist import PlaylistExpansion, is_playlist
+from utils.scheduler import Pipeline, DOWNLOADING, CONVERT_QUEUED, CONVERTING, FINISHED, FAILED, CANCELLED
+from utils.ratelimit import parse_rate, parse_schedule
+from utils.progress import ProgressThrottle, JsonlProgressLog, fan_out, format_event
+startup.mark("imports")
 
-vidConverter = Converter()
-ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
 SETTINGS_FILE = "settings.json"
 
 theme_styles = {
@@ -71,8 +73,9 @@ theme_styles = {
 def dump_all_files(error_message, folder, ui_state=""):
     error_log = "error.txt"
     try:
-        with open(error_log, "w", encoding="utf-8") as f:
-            f.write("Error occurred:\n")
+        # Appended so earlier failures of the same session are kept.
+        with open(error_log, "a", encoding="utf-8") as f:
+            f.write(f"Error occurred at {time.strftime('%Y-%m-%d %H:%M:%S')}:\n")
             f.write(error_message + "\n\n")
             f.write("UI State:\n" + ui_state + "\n\n")
             f.write("Dumping files in folder: " + folder + "\n")
@@ -82,52 +85,64 @@ def dump_all_files(error_message, folder, ui_state=""):
         print("Failed to dump error info:", e)
 
 
-# Worker thread for downloading
-class DownloadThread(QThread):
-    download_finished = pyqtSignal()
-    
-    def __init__(self, url, opts, ui_state="", parent=None):
-        super().__init__(parent)
-        self.url = url
-        self.opts = opts
-        self.ui_state = ui_state
-        
-    def run(self):
-        try:
-            with yt_dlp.YoutubeDL(self.opts) as ydl:
-                ydl.download([self.url])
-        except Exception as e:
-            dump_all_files(traceback.format_exc(), ".", self.ui_state)
-        self.download_finished.emit()
-
-# Worker thread for conversion
-class ConversionThread(QThread):
-    conversion_finished = pyqtSignal()
-    
-    def __init__(self, input_base, output_filedir, output_fileName, deletesOriginal, ui_state="", parent=None):
-        super().__init__(parent)
-        self.input_base = input_base
-        self.output_filedir = output_filedir
-        self.output_fileName = output_fileName
-        self.deletesOriginal = deletesOriginal
-        self.ui_state = ui_state
-        
-    def run(self):
-        try:
-            vidConverter.convert_webm_to_mp4(self.input_base, self.output_filedir, self.output_fileName, self.deletesOriginal)
-        except Exception as e:
-            dump_all_files(traceback.format_exc(), ".", self.ui_state)
-        self.conversion_finished.emit()
-
-
-
 class YouTubeTrimmer(QWidget):
+    # (job, state, detail) emitted from the pipeline's worker threads
+    job_state = pyqtSignal(object, str, object)
+    # (job, progress event) emitted from worker threads, throttled
+    job_progress = pyqtSignal(object, object)
+    # emitted from the listing thread once a playlist is listed completely
+    playlist_listed = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("GQIA YouTube Trimmer Tool")
         self.setGeometry(100, 100, 420, 250)
         
         self.last_selected_folder = self.load_last_selected_folder()
+
+        # One download at a time (the overlay blocks the card) but conversions
+        # keep running on the CPU pool while the next download is fetched.
+        self.converting_jobs = set()
+        self.job_state.connect(self.on_job_state)
+        self.playlist_listed.connect(lambda: self.card.on_playlist_listed())
+        self.pipeline = Pipeline(download_workers=1, on_state=self.job_state.emit)
+
+        # Optional media cache: set "media_cache_dir" in settings.json to reuse
+        # sources when cutting several clips from the same video.
+        settings = self.load_settings()
+        if settings.get("media_cache_dir"):
+            enable_media_cache(settings["media_cache_dir"], settings.get("media_cache_max_bytes"))
+        # Optional info cache: "info_cache_path" skips re-extracting recent URLs.
+        if settings.get("info_cache_path"):
+            enable_info_cache(settings["info_cache_path"], settings.get("info_cache_ttl"))
+        # Each download worker keeps one YoutubeDL (sessions, extractor state)
+        # across jobs; "ydl_pool": false in settings.json turns that off.
+        if settings.get("ydl_pool", True):
+            enable_ydl_pool()
+        # Shared bandwidth and per-site limits: "bandwidth_limit" ("4M"),
+        # "bandwidth_schedule" (["09:00-18:00=1M"]), "host_max_connections"
+        # and "host_requests_per_second".
+        try:
+            self.rate_limits = enable_rate_limits(parse_rate(settings.get("bandwidth_limit")),
+                                                  parse_schedule(settings.get("bandwidth_schedule")),
+                                                  settings.get("host_max_connections"),
+                                                  settings.get("host_requests_per_second"))
+        except ValueError as e:
+            print(f"Warning: ignoring rate limit settings: {e}")
+            self.rate_limits = enable_rate_limits()
+        # "fragments" is each job's DASH/HLS fragment concurrency and
+        # "max_connections" the budget shared by all running downloads.
+        self.fragments = settings.get("fragments", DEFAULT_FRAGMENTS)
+        if settings.get("max_connections"):
+            self.pipeline.connections.total = settings["max_connections"]
+
+        # Progress goes to the overlay (throttled so hooks cannot flood the
+        # event loop) and, with "progress_log" in settings.json, to a JSONL file.
+        self.conversion_progress = {}
+        self.job_progress.connect(self.on_job_progress)
+        progress_log = JsonlProgressLog(settings["progress_log"]) if settings.get("progress_log") else None
+        self.report_progress = fan_out(ProgressThrottle(self.job_progress.emit), progress_log)
+
         self.current_theme = "dark"  # Default to dark theme
         self.setStyleSheet(theme_styles[self.current_theme])
         
@@ -136,6 +151,10 @@ class YouTubeTrimmer(QWidget):
         self.card = Card(self, self.last_selected_folder)
         self.card.setStyleSheet(theme_styles[self.current_theme])
         self.layout.addWidget(self.card)
+
+        self.conversion_label = QLabel("")
+        self.conversion_label.setVisible(False)
+        self.layout.addWidget(self.conversion_label)
         
         self.theme_switcher = QPushButton("Toggle Theme")
         self.theme_switcher.clicked.connect(self.toggle_theme)
@@ -165,18 +184,22 @@ class YouTubeTrimmer(QWidget):
         super().resizeEvent(event)
         self.download_overlay.setGeometry(0, 0, self.width(), self.height())
     
-    def load_last_selected_folder(self):
+    def load_settings(self):
         if os.path.exists(SETTINGS_FILE):
             try:
                 with open(SETTINGS_FILE, "r") as file:
-                    settings = json.load(file)
-                    return settings.get("last_selected_folder", os.path.expanduser("~/Downloads"))
+                    return json.load(file)
             except (json.JSONDecodeError, FileNotFoundError):
                 pass
-        return os.path.expanduser("~/Downloads")
+        return {}
+
+    def load_last_selected_folder(self):
+        return self.load_settings().get("last_selected_folder", os.path.expanduser("~/Downloads"))
     
     def save_last_selected_folder(self, folder):
-        settings = {"last_selected_folder": folder}
+        # Keep other keys (e.g. media_cache_dir) that were set by hand.
+        settings = self.load_settings()
+        settings["last_selected_folder"] = folder
         with open(SETTINGS_FILE, "w") as file:
             json.dump(settings, file)
     
@@ -192,6 +215,42 @@ class YouTubeTrimmer(QWidget):
     def hide_download_overlay(self):
         self.download_overlay.hide()
     
+    def on_job_state(self, job, state, detail):
+        if state == DOWNLOADING:
+            if self.card.expansion is not None:
+                # Playlist entries download one after the other.
+                self.card.current_job = job
+            self.show_download_overlay(self.card.download_label())
+        elif state in (CONVERT_QUEUED, CONVERTING):
+            self.converting_jobs.add(job)
+            self.card.on_download_finished(job)
+        elif state in (FINISHED, FAILED, CANCELLED):
+            self.converting_jobs.discard(job)
+            self.conversion_progress.pop(job, None)
+            if state == FAILED:
+                dump_all_files(detail, ".", job.describe())
+            self.card.on_job_finished(job)
+        self.update_conversion_label()
+
+    def on_job_progress(self, job, event):
+        if event["stage"] == "convert":
+            if job in self.converting_jobs:
+                self.conversion_progress[job] = event
+                self.update_conversion_label()
+        elif job is self.card.current_job:
+            self.downloading_label.setText(f"{self.card.download_label()} {format_event(event)}")
+
+    def update_conversion_label(self):
+        count = len(self.converting_jobs)
+        text = f"Converting {count} file(s) in the background..."
+        # With a single conversion running its details fit on the label.
+        if count == 1:
+            event = self.conversion_progress.get(next(iter(self.converting_jobs)))
+            if event:
+                text += " " + format_event(event)
+        self.conversion_label.setText(text)
+        self.conversion_label.setVisible(count > 0)
+
     def cancel_current_download(self):
         # Call the card's cancel method to terminate any running thread.
         self.card.cancel_download()
@@ -202,6 +261,10 @@ class Card(QFrame):
         super().__init__(parent)
         self.setFrameShape(QFrame.Shape.Box)
         self.is_downloading = False
+        self.current_job = None
+        # PlaylistExpansion while a playlist or channel URL is being worked
+        # through; the overlay stays up until all its entries are done.
+        self.expansion = None
         layout = QVBoxLayout(self)
         
         # Top row: URL and folder selection
@@ -295,19 +358,6 @@ class Card(QFrame):
             return parts[0] * 60 + parts[1]
         return 0
     
-    def get_ui_state(self):
-        """Return a string with the current UI field values."""
-        state = []
-        state.append("URL: " + self.url_input.text())
-        state.append("Folder: " + self.folder_input.text())
-        state.append("Download Name: " + self.download_name_input.text())
-        state.append("Quality: " + self.quality_selector.currentText())
-        state.append("Partial: " + str(self.switch.isChecked()))
-        if self.switch.isChecked():
-            state.append("From: " + self.from_input.text())
-            state.append("To: " + self.to_input.text())
-        return "\n".join(state)
-    
     def update_download_button(self):
         url_valid = bool(self.url_input.text().strip())
         folder_valid = bool(self.folder_input.text().strip())
@@ -328,76 +378,78 @@ class Card(QFrame):
             return
         self.is_downloading = True
 
-        
-        # Use the download name from the input field (default to "input" if empty)
-        download_name = self.download_name_input.text().strip() or "input"
-        if self.quality_selector.currentText() == "audio-only":
-            # Ensure the output name ends with .wav for audio-only downloads
-            out_name = download_name if download_name.endswith(".wav") else download_name + ".wav"
-        else:
-            out_name = download_name if download_name.lower().endswith(".mp4") else download_name + ".mp4"
-
         if self.switch.isChecked():
-            global ffmpeg_path
-            ffmpeg_args = trim_args(self.from_input.text().strip(), self.to_input.text().strip())
-            opts = {
-            "outtmpl": os.path.join(self.folder_input.text(), out_name),
-            "external_downloader": ffmpeg_path,
-            "external_downloader_args": ffmpeg_args,
-            "format":  get_format_option(self.quality_selector.currentText()),
-            "merge_output_format": "mp4",
-        }
+            start, end = self.from_input.text().strip(), self.to_input.text().strip()
+        else:
+            start, end = None, None
+        # Use the download name from the input field (defaults to "input" if empty)
+        job = DownloadJob(
+            self.url_input.text().strip(),
+            self.folder_input.text(),
+            self.download_name_input.text().strip(),
+            self.quality_selector.currentText(),
+            start,
+            end,
+            fragments=self.parent().fragments,
+        )
+        job.on_progress = self.parent().report_progress
+        if is_playlist(job.url):
+            # Entries are queued as soon as they are listed, so the first one
+            # downloads while the rest of the playlist is still loading.
+            self.expansion = PlaylistExpansion(job, self.submit_job,
+                                               on_listed=lambda expansion: self.parent().playlist_listed.emit())
+            self.parent().show_download_overlay(self.download_label())
+            self.expansion.start()
         else:
-            opts = {
-                "outtmpl": os.path.join(self.folder_input.text(), out_name),
-                "format":  get_format_option(self.quality_selector.currentText()),
-                "merge_output_format": "mp4",
-            }
-        #opts["cookiefile"] = "cookies.txt"
+            self.current_job = job
+            self.submit_job(job)
 
-        url = self.url_input.text().strip()
-        
-        ui_state = self.get_ui_state()
-        # Show the overlay from the parent (main window)
-        self.parent().show_download_overlay()
-        
-        # Create and start the download thread
-        self.download_thread = DownloadThread(url, opts,ui_state, parent=self)
-        self.download_thread.download_finished.connect(self.on_download_finished)
-        self.download_thread.start()
-    
-    def on_download_finished(self):
-        download_name = self.download_name_input.text().strip() or "input"
-        # If the download name already ends with .mp3 or .wav, skip conversion.
-        if self.quality_selector.currentText() == "audio-only":
-            self.parent().hide_download_overlay()
+    def submit_job(self, job):
+        # Also called from a playlist's listing thread, once per entry.
+        submit_job(self.parent().pipeline, job)
+
+    def download_label(self):
+        if self.expansion is None:
+            return "Downloading..."
+        status = f"{self.expansion.done}/{self.expansion.listed} playlist entries done"
+        return f"Downloading... ({status}{'' if self.expansion.listing_done else ', listing...'})"
+
+    def on_playlist_listed(self):
+        if self.expansion is not None and self.expansion.finished:
+            self.on_job_finished(None)
+
+    def on_download_finished(self, job):
+        # The download slot is free again; conversion continues in the background.
+        if self.expansion is None and job is self.current_job:
+            self.current_job = None
             self.is_downloading = False
-            return
-        self.parent().show_download_overlay("Converting...")
-        input_base = os.path.join(self.folder_input.text(), download_name)
-        output_fileName = download_name if download_name.endswith(".mp4") else download_name + ".mp4"
-        # Create and start the conversion thread.
-        self.conversion_thread = ConversionThread(input_base, self.folder_input.text(), output_fileName, deletesOriginal=False)
-        self.conversion_thread.conversion_finished.connect(self.on_conversion_finished)
-        self.conversion_thread.start()
+            self.parent().hide_download_overlay()
 
-    def on_conversion_finished(self):
-        self.is_downloading = False
-        # Hide the overlay and reset overlay text
-        self.parent().hide_download_overlay()
-        self.parent().downloading_label.setText("Downloading...")
+    def on_job_finished(self, job):
+        if self.expansion is not None:
+            if not self.expansion.job_done(job):
+                self.parent().downloading_label.setText(self.download_label())
+                return
+            if self.expansion.error is not None and not self.expansion.listed:
+                dump_all_files(str(self.expansion.error), ".", self.expansion.template.describe())
+            self.expansion = None
+            self.current_job = job
+        if job is self.current_job:
+            self.current_job = None
+            self.is_downloading = False
+            # Hide the overlay and reset overlay text
+            self.parent().hide_download_overlay()
+            self.parent().downloading_label.setText("Downloading...")
 
     def cancel_download(self):
-        # If a download thread is running, terminate it.
-        if self.download_thread is not None and self.download_thread.isRunning():
-            self.download_thread.terminate()
-            self.download_thread.wait()
-            self.download_thread = None
-        # Also cancel conversion thread if running.
-        if hasattr(self, "conversion_thread") and self.conversion_thread is not None and self.conversion_thread.isRunning():
-            self.conversion_thread.terminate()
-            self.conversion_thread.wait()
-            self.conversion_thread = None
+        # Cooperative: the worker stops at its next check, ffmpeg is
+        # terminated and partial files are removed, other jobs keep running.
+        if self.expansion is not None:
+            self.expansion.cancel()
+            self.expansion = None
+        if self.current_job is not None:
+            self.current_job.cancel()
+            self.current_job = None
         self.is_downloading = False
         self.parent().hide_download_overlay()
 
@@ -406,5 +458,13 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon("yttrimmerIcon.ico"))  # Set the app icon
     window = YouTubeTrimmer()
+    startup.mark("window")
     window.show()
+    # Runs once the event loop has painted the window; the slow imports and
+    # ffmpeg lookup then happen off the GUI thread. "startup_report" in
+    # settings.json appends the timings to that file as JSON lines.
+    def after_first_paint():
+        startup.mark("first paint")
+        warm_up(startup, on_done=lambda: startup.report(window.load_settings().get("startup_report")))
+    QTimer.singleShot(0, after_first_paint)
     sys.exit(app.exec())
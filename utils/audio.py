@@ -0,0 +1,69 @@
+import os
+from utils.trimmer import _input_args, _run
+from utils.progress import FfmpegProgress
+
+# Output formats of the audio-only mode. "copy" lists the source codecs the
+# container takes as-is; anything else is encoded with "encode". "ranks"
+# overrides the source codec preference of utils.formatparser.
+AUDIO_FORMATS = {
+    "m4a": {"ext": ".m4a", "copy": ("aac", "alac"), "encode": ["-c:a", "aac", "-b:a", "192k"]},
+    "opus": {"ext": ".opus", "copy": ("opus",), "encode": ["-c:a", "libopus", "-b:a", "128k"],
+             "ranks": {"opus": 0, "mp4a": 1, "aac": 1, "vorbis": 2}},
+    "mp3": {"ext": ".mp3", "copy": ("mp3",), "encode": ["-c:a", "libmp3lame", "-q:a", "2"]},
+    "flac": {"ext": ".flac", "copy": ("flac",), "encode": ["-c:a", "flac"]},
+    "wav": {"ext": ".wav", "copy": (), "encode": ["-c:a", "pcm_s16le"]},
+}
+# m4a and opus hold what YouTube serves (AAC, Opus) without re-encoding;
+# mp3, flac and wav always transcode and have to be asked for.
+DEFAULT_AUDIO_FORMAT = "m4a"
+
+
+def audio_codec(acodec):
+    """Normalise a yt-dlp acodec ("mp4a.40.2", "opus") to an ffmpeg codec name."""
+    name = (acodec or "").split(".")[0].lower()
+    return {"mp4a": "aac"}.get(name, name)
+
+
+def audio_format_for_name(name):
+    """The audio format a file name asks for through its extension, or None."""
+    ext = os.path.splitext(name)[1].lower()
+    return next((fmt for fmt, spec in AUDIO_FORMATS.items() if spec["ext"] == ext), None)
+
+
+def can_copy(acodec, audio_format):
+    return audio_codec(acodec) in AUDIO_FORMATS[audio_format]["copy"]
+
+
+def extract_audio(source, output_file, audio_format=DEFAULT_AUDIO_FORMAT, start=None, end=None,
+                  duration=None, cancel_token=None, on_progress=None):
+    """Write the audio of source (a format dict or {"url": path}) to output_file.
+
+    A single ffmpeg reads the stream straight from its URL and writes the
+    output, so there is no intermediate download. With start/end (seconds)
+    only the byte ranges of that window are fetched. The stream is copied
+    when audio_format's container takes its codec and encoded otherwise.
+    Returns "copy" or "transcode".
+    """
+    spec = AUDIO_FORMATS[audio_format]
+    copy = can_copy(source.get("acodec"), audio_format)
+    command = _input_args(source, start)
+    if start is not None and end is not None:
+        command += ["-t", f"{end - start:.3f}"]
+        duration = end - start
+    command += ["-vn", "-map", "0:a:0"]
+    command += ["-c:a", "copy"] if copy else spec["encode"]
+    if spec["ext"] == ".m4a":
+        command += ["-movflags", "+faststart"]
+    progress = None
+    if on_progress is not None:
+        progress = FfmpegProgress(on_progress, duration, stage="trim" if start is not None else "download")
+    mode = "copy" if copy else "transcode"
+    print(f"🎵 Extracting audio ({mode}, {audio_codec(source.get('acodec')) or 'unknown'} -> {audio_format}): "
+          f"{output_file}")
+    try:
+        _run(command + [output_file], cancel_token, progress)
+    except BaseException:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    return mode
@@ -0,0 +1,13 @@
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_path():
+    """Path of the ffmpeg binary bundled through imageio_ffmpeg.
+
+    Resolved on first use instead of at import: importing imageio_ffmpeg and
+    locating the binary is slow on a cold start (notably from a PyInstaller
+    bundle), and the window should not wait for it.
+    """
+    import imageio_ffmpeg  # Ensures FFmpeg is available in the venv
+    return imageio_ffmpeg.get_ffmpeg_exe()
@@ -0,0 +1,87 @@
+import os
+import re
+import shutil
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ytdownloader", "media")
+DEFAULT_CACHE_MAX_BYTES = 5 * 1024 ** 3  # 5 GiB
+
+
+class MediaCache:
+    """On-disk cache of downloaded media keyed by (video id, format id).
+
+    Files live flat in cache_dir and are named after their key, so the same
+    source fetched at the same format is stored once. A file's mtime doubles
+    as its last-use time: hits touch it and eviction removes the least
+    recently used files until the cache fits in max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, video_id, format_id, ext):
+        name = re.sub(r"[^\w.+-]", "_", f"{video_id}.{format_id}")
+        return os.path.join(self.cache_dir, f"{name}.{ext}")
+
+    def _find(self, video_id, format_id):
+        prefix = os.path.basename(self._path(video_id, format_id, ""))
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and not name.endswith(".tmp"):
+                return os.path.join(self.cache_dir, name)
+        return None
+
+    def lookup(self, video_id, format_id):
+        """Return the cached file for the key, or None; counts a hit or miss."""
+        with self._lock:
+            path = self._find(video_id, format_id)
+            if path is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            os.utime(path)  # Mark as recently used
+            return path
+
+    def store(self, video_id, format_id, source_file):
+        """Copy source_file into the cache under the key and return its path."""
+        ext = os.path.splitext(source_file)[1].lstrip(".") or "bin"
+        path = self._path(video_id, format_id, ext)
+        temp_path = path + f".{threading.get_ident()}.tmp"
+        shutil.copyfile(source_file, temp_path)
+        os.replace(temp_path, path)  # Atomic, so readers never see half a file
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used files until the cache fits max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.endswith(".tmp") or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass  # In use on Windows; try again on the next eviction
+
+    def stats(self):
+        with self._lock:
+            files = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if not n.endswith(".tmp")]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(files),
+                "bytes": sum(os.path.getsize(f) for f in files if os.path.isfile(f)),
+            }
@@ -0,0 +1,128 @@
+import subprocess
+import threading
+
+# Seconds a cancelled ffmpeg gets to exit after SIGTERM before it is killed.
+TERMINATE_TIMEOUT = 5
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker once its job has been cancelled."""
+
+
+class CancelToken:
+    """Cooperative cancellation flag shared by one job's workers.
+
+    Workers call check() at safe points (yt-dlp progress hooks do so on every
+    chunk through progress_hook) and run child processes through
+    run_process(), which terminates and reaps them as soon as cancel() is
+    called.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._children = set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+            children = list(self._children)
+        for process in processes:
+            _terminate(process)
+        for child in children:
+            child.cancel()
+
+    def child(self):
+        """A token that is cancelled with this one but can also be cancelled alone.
+
+        Lets a stage stop its own helpers without marking the whole job as
+        cancelled; hand it back with release() when done.
+        """
+        child = CancelToken()
+        with self._lock:
+            self._children.add(child)
+        if self.cancelled:
+            child.cancel()
+        return child
+
+    def release(self, child):
+        with self._lock:
+            self._children.discard(child)
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, waking early when cancelled; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook; raising here aborts the download."""
+        self.check()
+
+    def _register(self, process):
+        with self._lock:
+            self._processes.add(process)
+        # cancel() may have run before the process was registered.
+        if self.cancelled:
+            _terminate(process)
+
+    def _unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+
+def _terminate(process):
+    if process.poll() is None:
+        process.terminate()
+
+
+def run_process(command, cancel_token=None, on_stdout_line=None, **kwargs):
+    """subprocess.run(command, check=True) that honours cancel_token.
+
+    The child is terminated (then killed if it lingers) and always reaped
+    when the token is cancelled, after which JobCancelled is raised.
+    With on_stdout_line, stdout is read as text while the process runs and
+    every line is passed to it (used for ffmpeg -progress pipe:1).
+    Returns the CompletedProcess; stdout/stderr are captured only when the
+    caller asks for it through kwargs.
+    """
+    if cancel_token is not None:
+        cancel_token.check()
+    if on_stdout_line is not None:
+        kwargs.update(stdout=subprocess.PIPE, text=True, errors="replace")
+    process = subprocess.Popen(command, **kwargs)
+    if cancel_token is not None:
+        cancel_token._register(process)
+    try:
+        try:
+            if on_stdout_line is not None:
+                for line in process.stdout:
+                    on_stdout_line(line)
+                stdout = None
+                _, stderr = process.communicate()
+            else:
+                stdout, stderr = process.communicate()
+        except BaseException:
+            _terminate(process)
+            raise
+    finally:
+        try:
+            process.wait(timeout=TERMINATE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if cancel_token is not None:
+            cancel_token._unregister(process)
+    if cancel_token is not None and cancel_token.cancelled:
+        raise JobCancelled()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
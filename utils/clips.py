@@ -0,0 +1,166 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.trimmer import time_to_seconds, smart_cut, _run, SMART_CUT_VIDEO_CODECS
+from utils.conversion import probe_media
+from utils.profiles import DEFAULT_PROFILE, resolve_profile, video_args, audio_args
+from utils.audio import AUDIO_FORMATS, extract_audio
+from utils.progress import FfmpegProgress
+from utils.cancel import CancelToken, JobCancelled
+
+
+def parse_clips(text):
+    """Parse one clip per line, "start end [name]" (commas work as separators too).
+
+    Times are HH:MM:SS, MM:SS or seconds; clips without a name are numbered.
+    Returns a list of (start, end, name) and raises ValueError on bad lines.
+    """
+    clips = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = re.split(r"[\s,]+", line, maxsplit=2)
+        if len(parts) < 2:
+            raise ValueError(f"Line {number}: expected 'start end [name]'")
+        start, end = parts[0], parts[1]
+        try:
+            window = time_to_seconds(end) - time_to_seconds(start)
+        except ValueError:
+            raise ValueError(f"Line {number}: bad time") from None
+        if window <= 0:
+            raise ValueError(f"Line {number}: clip ends before it starts")
+        name = parts[2].strip() if len(parts) > 2 else f"clip{len(clips) + 1:02d}"
+        clips.append((start, end, name))
+    names = [name for _, _, name in clips]
+    if len(set(names)) != len(names):
+        raise ValueError("Clip names must be unique")
+    return clips
+
+
+def load_clips(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return parse_clips(file.read())
+
+
+def clip_output_name(name, ext=".mp4"):
+    return name if name.lower().endswith(ext) else name + ext
+
+
+class _ClipProgress:
+    """Merges the "trim" events of parallel clip cuts into one overall event."""
+
+    def __init__(self, callback, durations):
+        self.callback = callback
+        self.total = sum(durations)
+        self.done = [0.0] * len(durations)
+        self._lock = threading.Lock()
+
+    def for_clip(self, index):
+        def update(event):
+            with self._lock:
+                self.done[index] = event.get("out_time") or 0.0
+                out_time = sum(self.done)
+            self.callback(dict(event, status="processing", out_time=out_time,
+                               percent=min(100.0, out_time * 100.0 / self.total), eta=None))
+        return update
+
+
+def cut_clips(source_file, clips, folder, trim_mode="smart", profile=DEFAULT_PROFILE, target_seconds=None,
+              audio_format=None, cancel_token=None, on_progress=None, threads=None):
+    """Cut every (start, end, name) clip out of the local file source_file.
+
+    The source has been fetched once, so each clip only costs its own cut:
+    - audio_format set: the audio of each clip is extracted (copied when
+      the container allows it), clips in parallel;
+    - trim_mode "smart" with an H.264/HEVC source: clips are cut in
+      parallel smart_cut passes that stream-copy everything between the
+      first and last keyframe and re-encode just the partial GOPs;
+    - otherwise one ffmpeg decodes the source once and encodes every clip
+      as a separate output.
+    threads caps parallel passes (or the encoder threads of the single
+    pass). Returns the list of written files; on failure or cancellation
+    none of them are left behind.
+    """
+    media = probe_media(source_file)
+    windows = [(time_to_seconds(start), time_to_seconds(end)) for start, end, _ in clips]
+    ext = AUDIO_FORMATS[audio_format]["ext"] if audio_format else ".mp4"
+    outputs = [os.path.join(folder, clip_output_name(name, ext)) for _, _, name in clips]
+    progress = _ClipProgress(on_progress, [end - start for start, end in windows]) if on_progress else None
+    try:
+        if audio_format or (trim_mode == "smart" and media["video"] in SMART_CUT_VIDEO_CODECS):
+            mode = "audio" if audio_format else "smart"
+            print(f"✂️ Cutting {len(clips)} clip(s) from {os.path.basename(source_file)} ({mode} passes)")
+            _parallel_cuts(source_file, media, windows, outputs, audio_format, profile, target_seconds,
+                           cancel_token, progress, threads)
+        else:
+            mode = "transcode"
+            print(f"✂️ Cutting {len(clips)} clip(s) from {os.path.basename(source_file)} (one pass)")
+            _single_pass(source_file, media, windows, outputs, profile, target_seconds, cancel_token,
+                         on_progress, threads)
+    except BaseException:
+        for output in outputs:
+            if os.path.exists(output):
+                os.remove(output)
+        raise
+    if on_progress is not None:
+        on_progress({"stage": "trim", "status": "finished", "percent": 100.0})
+    return outputs
+
+
+def _parallel_cuts(source_file, media, windows, outputs, audio_format, profile, target_seconds,
+                   cancel_token, progress, threads):
+    video = {"url": source_file, "vcodec": media["video"], "height": media["height"]}
+    audio = {"url": source_file, "acodec": media["audio"]} if media["audio"] else None
+    if audio_format and audio is None:
+        raise RuntimeError("No audio stream in " + source_file)
+    # One clip failing stops the others through this token; the job's own
+    # token is left alone so a retry does not look like a user cancel.
+    cuts_token = cancel_token.child() if cancel_token is not None else CancelToken()
+
+    def cut(index):
+        start, end = windows[index]
+        on_progress = progress.for_clip(index) if progress is not None else None
+        if audio_format:
+            extract_audio(audio, outputs[index], audio_format, start, end, cancel_token=cuts_token,
+                          on_progress=on_progress)
+        else:
+            smart_cut(video, audio, outputs[index], start, end, profile=profile, target_seconds=target_seconds,
+                      cancel_token=cuts_token, on_progress=on_progress)
+
+    workers = max(1, min(len(windows), threads or os.cpu_count() or 1))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="clip") as pool:
+            futures = [pool.submit(cut, index) for index in range(len(windows))]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except BaseException as e:
+                    errors.append(e)
+                    cuts_token.cancel()
+    finally:
+        if cancel_token is not None:
+            cancel_token.release(cuts_token)
+    if errors:
+        # Report the clip that failed, not the ones stopped because of it.
+        raise next((e for e in errors if not isinstance(e, JobCancelled)), errors[0])
+
+
+def _single_pass(source_file, media, windows, outputs, profile, target_seconds, cancel_token, on_progress, threads):
+    base = min(start for start, _ in windows)
+    last = max(end for _, end in windows)
+    settings = resolve_profile(profile, {"duration": sum(end - start for start, end in windows),
+                                         "height": media["height"], "fps": media["fps"]}, target_seconds)
+    # Input seek to the first clip and stop after the last one: the source is
+    # decoded once and each output keeps only its own window.
+    command = ["-ss", f"{base:.3f}", "-t", f"{last - base:.3f}", "-i", source_file]
+    for (start, end), output in zip(windows, outputs):
+        command += ["-ss", f"{start - base:.3f}", "-t", f"{end - start:.3f}", "-map", "0:v:0?", "-map", "0:a:0?"]
+        command += video_args(settings) + ["-pix_fmt", "yuv420p"] + audio_args(settings)
+        if threads:
+            command += ["-threads", str(threads)]
+        command += ["-movflags", "+faststart", output]
+    progress = FfmpegProgress(on_progress, last - base, stage="trim") if on_progress is not None else None
+    _run(command, cancel_token, progress)
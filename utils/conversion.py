@@ -1,58 +1,198 @@
-
 import subprocess
 import os
-import imageio_ffmpeg  # Ensures FFmpeg is available in the venv
+import re
+from contextlib import contextmanager
+from utils.binaries import ffmpeg_path
+from utils.profiles import DEFAULT_PROFILE, resolve_profile, video_args, audio_args
+from utils.cancel import JobCancelled, run_process
+from utils.progress import FFMPEG_PROGRESS_ARGS, FfmpegProgress
+
+# Codecs that can be remuxed into an MP4 container without re-encoding.
+MP4_VIDEO_CODECS = ("h264", "hevc")
+MP4_AUDIO_CODECS = ("aac",)
+
+
+def probe_media(input_file):
+    """Return codecs, duration, height and fps of the first streams of input_file.
+
+    The dict has "video"/"audio" codec names (None when the stream is
+    missing) plus "duration" (seconds), "height" and "fps" when known.
+    imageio_ffmpeg only ships ffmpeg (no ffprobe), so the stream info is read
+    from the banner ffmpeg prints when given an input and no output.
+    """
+    result = subprocess.run(
+        [ffmpeg_path(), "-hide_banner", "-i", input_file],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace"
+    )
+    media = {"video": None, "audio": None, "duration": None, "height": None, "fps": None}
+    for kind, codec in re.findall(r"Stream #\d+:\d+.*?: (Video|Audio): (\w+)", result.stderr):
+        key = kind.lower()
+        if media[key] is None:
+            media[key] = codec
+    duration = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        media["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    size = re.search(r"Video: .*?, (\d{2,5})x(\d{2,5})", result.stderr)
+    if size:
+        media["height"] = int(size.group(2))
+    fps = re.search(r"Video: .*?, ([\d.]+) fps", result.stderr)
+    if fps:
+        media["fps"] = float(fps.group(1))
+    return media
+
+
+def can_stream_copy(codecs):
+    """True when the probed streams can go into an MP4 as-is."""
+    if codecs["video"] is None:
+        return False
+    if codecs["video"] not in MP4_VIDEO_CODECS:
+        return False
+    return codecs["audio"] is None or codecs["audio"] in MP4_AUDIO_CODECS
 
-ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
 
 class Converter:
     def __init__(self):
         pass
 
-    def convert_webm_to_mp4(self, input_base, output_filedir, output_fileName, deletesOriginal):
+    def convert_webm_to_mp4(self, input_file, output_filedir, output_fileName, deletesOriginal,
+                            profile=DEFAULT_PROFILE, target_seconds=None, cancel_token=None, on_progress=None,
+                            threads=None):
+        """Convert the downloaded file input_file to MP4.
+
+        input_file is the exact path the download produced (yt-dlp reports it
+        through its postprocessor hooks); nothing is guessed from the folder.
+        When it already is the output file and needs re-encoding, the encode
+        goes to a temporary file that then replaces it.
+
+        profile names one of utils.profiles.ENCODE_PROFILES (or "auto", which
+        picks the x264 preset that should finish within target_seconds).
+        Cancelling cancel_token stops ffmpeg, removes the partial output and
+        raises JobCancelled. on_progress receives progress events (percent,
+        encode fps, speed, ETA) parsed from ffmpeg's -progress output.
+        threads caps the encoder threads (default: ffmpeg uses every core).
+
+        Returns "copy" when the streams were remuxed, "transcode" when they had
+        to be re-encoded, "skip" when the input already is the MP4-compatible
+        output file, or None on failure.
+        """
+        plan = self.plan_conversion(input_file, output_filedir, output_fileName, profile, target_seconds,
+                                    on_progress, threads)
+        if plan is None or plan["mode"] == "skip":
+            return plan and plan["mode"]
+        try:
+            with self.running(plan):
+                progress = plan["progress"]
+                run_process(plan["command"], cancel_token, on_stdout_line=progress and progress.feed)
+        except subprocess.CalledProcessError:
+            return None
+        return self.finish_conversion(plan, deletesOriginal)
+
+    def plan_conversion(self, input_file, output_filedir, output_fileName, profile=DEFAULT_PROFILE,
+                        target_seconds=None, on_progress=None, threads=None):
+        """Probe input_file and build the ffmpeg command that converts it.
+
+        This is the first half of convert_webm_to_mp4, for callers that run
+        ffmpeg themselves (utils.engine does so with asyncio) inside
+        running(plan) and then call finish_conversion(). Returns None
+        when input_file is missing, otherwise a plan dict with "mode"
+        ("copy", "transcode" or "skip"), "command", "progress" (an
+        FfmpegProgress or None), "input_file", "output_file" and "in_place".
+        """
         # Create the output directory if needed.
         if output_filedir and not os.path.exists(output_filedir):
             os.makedirs(output_filedir)
-        
-        # Try to locate the downloaded file using common extensions.
-        possible_extensions = [".mp4", ".mmp4", ".mkv", ".webm"]
-        input_file = None
-        for ext in possible_extensions:
-            candidate = input_base + ext
-            if os.path.exists(candidate):
-                input_file = candidate
-                break
-
-        if input_file is None:
-            print(f"❌ No file found for base name: {input_base}")
-            return
+
+        if not input_file or not os.path.exists(input_file):
+            print(f"❌ Downloaded file not found: {input_file}")
+            return None
 
         # Build the output file path
         output_file = os.path.join(output_filedir, output_fileName)
-        
-        # Build the ffmpeg command.
-        command = [
-            ffmpeg_path,         # Use FFmpeg from imageio_ffmpeg
-            "-i", input_file,    # Input file
-            "-c:v", "libx264",   # Encode video with H.264 (MP4-compatible)
-            "-preset", "fast",   # Higher quality compression
-            "-crf", "22",         # Constant Rate Factor (lower = better quality)
-            "-c:a", "aac",       # Convert audio to AAC
-            "-b:a", "192k",      # Set audio bitrate
-            "-movflags", "+faststart",
-            "-y",                # Overwrite output if exists
-            output_file
-        ]
-        
+        in_place = os.path.abspath(input_file) == os.path.abspath(output_file)
+        plan = {"input_file": input_file, "output_file": output_file, "in_place": in_place,
+                "command": None, "progress": None}
+
+        codecs = probe_media(input_file)
+        if can_stream_copy(codecs):
+            if in_place:
+                print(f"⏩ Already MP4-compatible ({codecs['video']}/{codecs['audio']}), nothing to do: {output_file}")
+                return dict(plan, mode="skip")
+            mode = "copy"
+            command = [
+                ffmpeg_path(),
+                "-i", input_file,
+                "-c", "copy",        # Remux only, streams are already MP4-compatible
+            ]
+            if codecs["video"] == "hevc":
+                command += ["-tag:v", "hvc1"]  # Lets Apple players recognise HEVC in MP4
+            command += ["-movflags", "+faststart", "-y", output_file]
+            detail = "stream copy"
+        else:
+            if in_place:
+                # Never encode onto the file being read.
+                base, ext = os.path.splitext(output_file)
+                output_file = base + ".converting" + ext
+            mode = "transcode"
+            settings = resolve_profile(profile, codecs, target_seconds)
+            # Build the ffmpeg command.
+            command = [
+                ffmpeg_path(),       # Use FFmpeg from imageio_ffmpeg
+                "-i", input_file,    # Input file
+            ]
+            command += video_args(settings)  # H.264 at the profile's preset/CRF
+            command += audio_args(settings)  # AAC at the profile's bitrate
+            if threads:
+                command += ["-threads", str(threads)]  # Share the cores with other conversions
+            command += [
+                "-movflags", "+faststart",
+                "-y",                # Overwrite output if exists
+                output_file
+            ]
+            detail = f"{settings['name']} profile, preset {settings['preset']}, {threads or 'all'} thread(s)"
+
+        print(f"🔧 Converting with {mode} ({codecs['video']}/{codecs['audio']}, {detail}): {input_file}")
+        progress = None
+        if on_progress is not None:
+            # Machine-readable progress on stdout, only when someone listens.
+            progress = FfmpegProgress(on_progress, codecs["duration"])
+            command[1:1] = FFMPEG_PROGRESS_ARGS
+        return dict(plan, mode=mode, command=command, progress=progress, output_file=output_file)
+
+    @contextmanager
+    def running(self, plan):
+        """Wrap the ffmpeg run of a plan, however it is started.
+
+        A cancelled or failed run has its partial output removed; the
+        JobCancelled or CalledProcessError is re-raised.
+        """
         try:
-            subprocess.run(command, check=True)
-            print(f"✅ Conversion successful: {output_file}")
-            if deletesOriginal:
-                if os.path.exists(input_file):
-                    os.remove(input_file)
-                    print(f"🗑️ Deleted original file: {input_file}")
-                else:
-                    print(f"⚠️ File not found: {input_file}")
+            yield plan
+        except JobCancelled:
+            self.abort_conversion(plan)
+            print(f"🛑 Conversion cancelled: {plan['output_file']}")
+            raise
         except subprocess.CalledProcessError as e:
             print(f"❌ FFmpeg error: {e}")
+            self.abort_conversion(plan)
+            raise
+
+    def finish_conversion(self, plan, deletesOriginal):
+        """Put a plan's finished output in place; returns its mode."""
+        input_file, output_file = plan["input_file"], plan["output_file"]
+        if plan["in_place"]:
+            os.replace(output_file, input_file)
+            output_file = input_file
+        print(f"✅ Conversion successful ({plan['mode']}): {output_file}")
+        if deletesOriginal and not plan["in_place"]:
+            if os.path.exists(input_file):
+                os.remove(input_file)
+                print(f"🗑️ Deleted original file: {input_file}")
+            else:
+                print(f"⚠️ File not found: {input_file}")
+        return plan["mode"]
 
+    def abort_conversion(self, plan):
+        """Remove what a failed or cancelled plan wrote; the input is never touched."""
+        if os.path.exists(plan["output_file"]) and plan["output_file"] != plan["input_file"]:
+            os.remove(plan["output_file"])
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.cancel import JobCancelled, TERMINATE_TIMEOUT
+from utils.jobs import download, convert, needs_conversion, retry_delay, vidConverter, span, conversion_probe
+from utils.scheduler import ConnectionBudget, JobStates, split_cores
+
+
+class _ProcessHandle:
+    """Lets a CancelToken terminate an asyncio subprocess like a Popen."""
+
+    def __init__(self, process):
+        self.process = process
+
+    def poll(self):
+        return self.process.returncode
+
+    def terminate(self):
+        try:
+            self.process.terminate()
+        except ProcessLookupError:
+            pass  # Exited in the meantime
+
+
+async def run_ffmpeg(command, cancel_token=None, on_stdout_line=None):
+    """asyncio counterpart of utils.cancel.run_process.
+
+    The child's stdout is read without blocking the event loop and every
+    line goes to on_stdout_line (ffmpeg -progress pipe:1). Cancelling
+    cancel_token, or the awaiting task, terminates the child (then kills
+    it if it lingers) and always reaps it.
+    """
+    if cancel_token is not None:
+        cancel_token.check()
+    stdout = asyncio.subprocess.PIPE if on_stdout_line is not None else None
+    process = await asyncio.create_subprocess_exec(*command, stdout=stdout)
+    handle = _ProcessHandle(process)
+    if cancel_token is not None:
+        cancel_token._register(handle)
+    try:
+        try:
+            if on_stdout_line is not None:
+                async for line in process.stdout:
+                    on_stdout_line(line.decode("utf-8", "replace"))
+            await process.wait()
+        except BaseException:
+            handle.terminate()
+            raise
+    finally:
+        try:
+            await asyncio.wait_for(asyncio.shield(process.wait()), TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        if cancel_token is not None:
+            cancel_token._unregister(handle)
+    if cancel_token is not None and cancel_token.cancelled:
+        raise JobCancelled()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return process.returncode
+
+
+class AsyncEngine:
+    """UI-agnostic download -> convert engine on an asyncio event loop.
+
+    Every job is one task: queued jobs wait on a semaphore instead of
+    holding a thread, yt-dlp (which blocks) runs on a pool of
+    download_workers executor threads, and conversions run ffmpeg through
+    asyncio subprocesses with their -progress output parsed on the loop, so
+    hundreds of jobs can be in flight with only the download threads
+    behind them. Clip lists, whose cuts chain several ffmpeg runs, still
+    convert on a thread.
+
+    submit(), cancel(), result(), join() and events() must be used from
+    the engine's loop (EngineThread wraps all of this for synchronous
+    front-ends). on_state(job, state, detail) reports the states of
+    utils.scheduler.JobStates, like Pipeline does. connections is the ConnectionBudget shared by
+    all downloads.
+    """
+
+    def __init__(self, download_workers=3, convert_workers=None, on_state=None, max_connections=16,
+                 delete_original=False):
+        self.on_state = on_state
+        self.states = JobStates(self._report)
+        self.delete_original = delete_original
+        # ConnectionBudget reserves a connection per download slot it sees here.
+        self.max_workers = max(1, int(download_workers))
+        self.convert_workers = convert_workers or os.cpu_count() or 1
+        self.connections = ConnectionBudget(max_connections, self)
+        self._download_slots = asyncio.Semaphore(self.max_workers)
+        self._convert_slots = asyncio.Semaphore(self.convert_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download")
+        self._tasks = {}
+        # Conversions running or waiting for a slot.
+        self._convert_load = 0
+        self._subscribers = set()
+        self._loop = None
+
+    def submit(self, job):
+        """Queue job and return the task that runs it.
+
+        The task's result is what the last stage returned (the conversion
+        mode, or the downloaded file for audio-only jobs); it raises
+        JobCancelled or the failure.
+        """
+        self._loop = asyncio.get_running_loop()
+        forward = job.on_progress
+
+        def on_progress(job, event):
+            # Called from download threads as well as from the loop.
+            if forward is not None:
+                forward(job, event)
+            self._loop.call_soon_threadsafe(self._publish, job, "progress", event)
+        job.on_progress = on_progress
+        self.states.queued(job, "download")
+        task = self._loop.create_task(self._run(job))
+        # Failures are reported through on_state/events; awaiting is optional.
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self._tasks[job] = task
+        return task
+
+    def cancel(self, job):
+        """Stop job at its next safe point; its task ends with JobCancelled."""
+        job.cancel()
+
+    async def result(self, job):
+        return await self._tasks[job]
+
+    async def join(self):
+        """Wait until every submitted job is done, including ones submitted meanwhile."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def events(self):
+        """Async iterator of (job, kind, payload) events.
+
+        kind is "state" (payload: (state, detail)) or "progress" (payload:
+        a utils.progress event). Only events after subscribing are seen.
+        """
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
+
+    def conversion_threads(self):
+        """Encoder threads for a conversion starting now (see utils.scheduler.split_cores)."""
+        return split_cores(self.convert_workers, self._convert_load)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _publish(self, job, kind, payload):
+        for queue in self._subscribers:
+            queue.put_nowait((job, kind, payload))
+
+    def _report(self, job, state, detail=None):
+        if self.on_state is not None:
+            self.on_state(job, state, detail)
+        self._publish(job, "state", (state, detail))
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._download_slots:
+                job.cancel_token.check()
+                self.states.started(job, "download")
+                result = await loop.run_in_executor(self._executor, download, job, self.connections)
+            if needs_conversion(job):
+                self.states.queued(job, "convert")
+                self._convert_load += 1
+                try:
+                    async with self._convert_slots:
+                        job.cancel_token.check()
+                        self.states.started(job, "convert")
+                        result = await self._convert(job, loop)
+                finally:
+                    self._convert_load -= 1
+        except Exception as e:
+            self.states.ended(job, e)
+            raise
+        else:
+            self.states.ended(job, result=result)
+            return result
+        finally:
+            self._tasks.pop(job, None)
+
+    async def _convert(self, job, loop):
+        threads = self.conversion_threads()
+        if job.clips:
+            return await loop.run_in_executor(None, lambda: convert(job, self.delete_original, threads))
+        # The asyncio counterpart of utils.jobs.with_retries around _convert_file.
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with span(job, "convert", threads=threads) as fields:
+                    mode = await self._convert_file(job, loop, threads, conversion_probe(job, fields))
+                    fields["mode"] = mode
+                    return mode
+            except JobCancelled:
+                raise
+            except Exception as e:
+                delay = retry_delay(job, "conversion", e, attempt)
+                if await loop.run_in_executor(None, job.cancel_token.wait, delay):
+                    raise JobCancelled() from e
+
+    async def _convert_file(self, job, loop, threads, on_progress):
+        # Probing is a short blocking ffmpeg run; the conversion itself is async.
+        plan = await loop.run_in_executor(None, lambda: vidConverter.plan_conversion(
+            job.downloaded_file, job.folder, job.output_name, job.profile, job.target_seconds,
+            on_progress, threads))
+        if plan is None:
+            raise RuntimeError("Conversion failed for " + job.output_name)
+        if plan["mode"] == "skip":
+            return "skip"
+        progress = plan["progress"]
+        try:
+            with vidConverter.running(plan):
+                await run_ffmpeg(plan["command"], job.cancel_token, progress and progress.feed)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError("Conversion failed for " + job.output_name) from e
+        return vidConverter.finish_conversion(plan, self.delete_original)
+
+
+class EngineThread:
+    """An AsyncEngine on its own event loop thread, for synchronous front-ends.
+
+    submit(), cancel() and join() may be called from any thread (the Qt GUI
+    thread, a playlist listing thread, ...). on_state and the jobs'
+    on_progress callbacks run on the loop thread, so Qt front-ends forward
+    them to signals just like with Pipeline.
+    """
+
+    def __init__(self, download_workers=3, convert_workers=None, on_state=None, max_connections=16,
+                 delete_original=False):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="engine", daemon=True)
+        self._thread.start()
+        self.engine = self._call(self._create, download_workers, convert_workers, on_state, max_connections,
+                                 delete_original)
+
+    @staticmethod
+    async def _create(*args):
+        # The engine's semaphores belong to the loop they are made on.
+        return AsyncEngine(*args)
+
+    def _call(self, coro_function, *args):
+        return asyncio.run_coroutine_threadsafe(coro_function(*args), self.loop).result()
+
+    @property
+    def connections(self):
+        return self.engine.connections
+
+    def submit(self, job):
+        """Queue job; returns a concurrent.futures.Future for its result."""
+        async def run():
+            return await self.engine.submit(job)
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    def cancel(self, job):
+        self.loop.call_soon_threadsafe(self.engine.cancel, job)
+
+    def join(self):
+        """Block until every submitted job is done."""
+        self._call(self.engine.join)
+
+    def close(self):
+        """Stop the loop once the jobs are done."""
+        self.join()
+        self.engine.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,104 @@
+import re
+import socket
+import subprocess
+from utils.ratelimit import backoff_delay, throttle_status
+
+# Failure classes a job can end with (job.failure).
+NETWORK = "network-transient"
+THROTTLED = "throttled"
+FORMAT_UNAVAILABLE = "format-unavailable"
+EXTRACTOR_BROKEN = "extractor-broken"
+FFMPEG_FAILED = "ffmpeg-failed"
+MISSING_DEPENDENCY = "missing-dependency"
+UNKNOWN = "unknown"
+
+# Message fragments (lower case) per class, checked in the order of classify().
+_MISSING_MESSAGES = ("ffmpeg is not installed", "ffmpeg not found", "ffprobe not found",
+                     "ffprobe and ffmpeg not found", "no ffmpeg exe could be found")
+# ffmpeg's own "Conversion failed!", yt-dlp's postprocessor and downloader
+# errors and the exit status of a run; not every mention of "ffmpeg".
+_FFMPEG_MESSAGES = ("conversion failed", "postprocessing:", "ffmpeg exited with code",
+                    "returned non-zero exit status")
+_UNAVAILABLE_MESSAGES = ("requested format is not available", "no video formats found", "video unavailable",
+                         "private video", "this video is not available", "has been removed",
+                         "members-only", "no audio stream")
+_NETWORK_MESSAGES = ("timed out", "connection reset", "connection refused", "connection aborted",
+                     "temporary failure in name resolution", "name or service not known", "getaddrinfo failed",
+                     "network is unreachable", "remote end closed", "incompleteread", "incomplete read",
+                     "ssl:", "unable to download webpage")
+_EXTRACTOR_MESSAGES = ("unable to extract", "unsupported url", "please report this issue")
+
+
+class RetryPolicy:
+    """How often a failure class is retried and how long to wait in between."""
+
+    def __init__(self, attempts, base=0.0, cap=0.0):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt):
+        """Seconds to wait after the attempt-th failure (exponential, jittered)."""
+        return backoff_delay(attempt, self.base, self.cap) if self.base else 0.0
+
+
+# Transient and throttling failures are retried with growing waits; the
+# others would fail the same way again, so their job stops at once instead
+# of spending download and CPU time on doomed work.
+RETRY_POLICIES = {
+    NETWORK: RetryPolicy(4, base=2.0, cap=60.0),
+    THROTTLED: RetryPolicy(4, base=15.0, cap=300.0),
+    FORMAT_UNAVAILABLE: RetryPolicy(1),
+    EXTRACTOR_BROKEN: RetryPolicy(2, base=10.0, cap=10.0),  # YouTube layout experiments come and go
+    FFMPEG_FAILED: RetryPolicy(1),
+    MISSING_DEPENDENCY: RetryPolicy(1),  # Stays missing until someone installs it
+    UNKNOWN: RetryPolicy(1),
+}
+
+
+class JobFailed(Exception):
+    """A job stage failed for good; failure is one of the classes above."""
+
+    def __init__(self, failure, stage, error, attempts):
+        super().__init__(f"[{failure}] {stage} failed after {attempts} attempt(s): {error}")
+        self.failure = failure
+        self.stage = stage
+        self.error = error
+        self.attempts = attempts
+
+
+def _chain(error):
+    """error and every error it wraps (causes, yt-dlp's exc_info)."""
+    errors = []
+    while isinstance(error, BaseException) and not any(error is seen for seen in errors):
+        errors.append(error)
+        exc_info = getattr(error, "exc_info", None)
+        wrapped = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        error = wrapped or getattr(error, "cause", None) or error.__cause__ or error.__context__
+    return errors
+
+
+def classify(error):
+    """Failure class of an exception raised by a download or conversion."""
+    if isinstance(error, JobFailed):
+        return error.failure
+    errors = _chain(error)
+    messages = " ".join(str(e) for e in errors).lower()
+    names = {type(e).__name__ for e in errors}
+    if any(m in messages for m in _MISSING_MESSAGES) or any(
+            isinstance(e, FileNotFoundError) and re.search(r"ff(mpeg|probe)", str(e.filename or "").lower())
+            for e in errors):
+        return MISSING_DEPENDENCY
+    if any(isinstance(e, subprocess.CalledProcessError) for e in errors) or any(
+            m in messages for m in _FFMPEG_MESSAGES):
+        return FFMPEG_FAILED
+    if any(throttle_status(e) for e in errors):
+        return THROTTLED
+    if any(m in messages for m in _UNAVAILABLE_MESSAGES):
+        return FORMAT_UNAVAILABLE
+    if (any(isinstance(e, (ConnectionError, TimeoutError, socket.gaierror)) for e in errors)
+            or re.search(r"http error 5\d\d", messages) or any(m in messages for m in _NETWORK_MESSAGES)):
+        return NETWORK
+    if names & {"ExtractorError", "RegexNotFoundError"} or any(m in messages for m in _EXTRACTOR_MESSAGES):
+        return EXTRACTOR_BROKEN
+    return UNKNOWN
@@ -1,23 +1,115 @@
+QUALITY_HEIGHTS = {
+    "4320p": 4320,
+    "2160p": 2160,
+    "1440p": 1440,
+    "1080p": 1080,
+    "720p": 720,
+    "480p": 480,
+    "360p": 360,
+    "240p": 240,
+    "144p": 144,
+}
+
+# Lower rank wins. MP4-friendly codecs come first so the converter can
+# stream-copy instead of transcoding.
+VIDEO_CODEC_RANK = {"avc1": 0, "h264": 0, "hev1": 1, "hvc1": 1, "hevc": 1, "vp09": 2, "vp9": 2, "av01": 3}
+AUDIO_CODEC_RANK = {"mp4a": 0, "aac": 0, "opus": 1, "vorbis": 2}
+
 
 def get_format_option(quality):
     """Returns the yt-dlp format string based on user input."""
-    if quality == "4320p":
-        return "bestvideo[height<=4320][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    if quality == "2160":
-        return "bestvideo[height<=2160][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    if quality == "1440p":
-        return "bestvideo[height<=1440p][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    if quality == "1080p":
-        return "bestvideo[height<=1080][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    elif quality == "720p":
-        return "bestvideo[height<=720][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    elif quality == "480p":
-        return "bestvideo[height<=480][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    elif quality == "360p":
-        return "bestvideo[height<=360][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    elif quality == "144p":
-        return "bestvideo[height<=144][vcodec^=avc]+bestaudio[ext=m4a]/best"
-    elif quality == "audio-only":
+    if quality == "audio-only":
         return "bestaudio/best"
+    if quality not in QUALITY_HEIGHTS:
+        raise ValueError(f"Unknown quality: {quality}")
+    height = QUALITY_HEIGHTS[quality]
+    return f"bestvideo[height<={height}][vcodec^=avc]+bestaudio[ext=m4a]/best[height<={height}]/best"
+
+
+def _codec_rank(codec, ranks):
+    return ranks.get((codec or "").split(".")[0], len(ranks))
+
+
+def _bitrate(fmt):
+    return fmt.get("tbr") or fmt.get("vbr") or fmt.get("abr") or 0
+
+
+def estimate_size(fmt, duration=None):
+    """Best guess of a format's size in bytes, or None when unknown."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return int(size)
+    if duration and _bitrate(fmt):
+        return int(_bitrate(fmt) * 1000 / 8 * duration)
+    return None
+
+
+def _has_video(fmt):
+    return fmt.get("vcodec") not in (None, "none")
+
+
+def _has_audio(fmt):
+    return fmt.get("acodec") not in (None, "none")
+
+
+def _best_audio(formats, ranks=AUDIO_CODEC_RANK):
+    audio = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    if not audio:
+        return None
+    return min(audio, key=lambda f: (_codec_rank(f.get("acodec"), ranks), -_bitrate(f)))
+
+
+def _best_video(formats, height):
+    videos = [f for f in formats if _has_video(f) and f.get("height")]
+    if not videos:
+        return None
+    fitting = [f for f in videos if f["height"] <= height]
+    if fitting:
+        # Tallest that fits the request...
+        target = max(f["height"] for f in fitting)
     else:
-        return "bestvideo+bestaudio/best"  # Default to highest quality
\ No newline at end of file
+        # ...or, if everything is taller, the smallest one available.
+        target = min(f["height"] for f in videos)
+    candidates = [f for f in videos if f["height"] == target]
+    return min(candidates, key=lambda f: (
+        _codec_rank(f.get("vcodec"), VIDEO_CODEC_RANK),
+        _has_audio(f),  # Separate streams are usually better than muxed ones
+        -(f.get("fps") or 0),
+        -_bitrate(f),
+    ))
+
+
+def resolve_format(formats, quality, duration=None, audio_ranks=None):
+    """Pick the format(s) to download for quality from an extracted format list.
+
+    Rules: the tallest video not above the requested height (the smallest
+    one if all are taller), then H.264 over HEVC over VP9 over AV1, then
+    higher fps and bitrate; audio prefers AAC then Opus, then bitrate.
+    Returns {"format": yt-dlp format spec, "video", "audio", "height",
+    "size"}, where size is the expected total in bytes (None if unknown),
+    or None when the list holds nothing usable. audio_ranks overrides
+    AUDIO_CODEC_RANK, e.g. to prefer Opus when that is the output codec.
+    """
+    audio_ranks = audio_ranks or AUDIO_CODEC_RANK
+    if quality == "audio-only":
+        audio = _best_audio(formats, audio_ranks)
+        if audio is None:
+            return None
+        return {"format": audio["format_id"], "video": None, "audio": audio,
+                "height": None, "size": estimate_size(audio, duration)}
+
+    if quality not in QUALITY_HEIGHTS:
+        raise ValueError(f"Unknown quality: {quality}")
+    video = _best_video(formats, QUALITY_HEIGHTS[quality])
+    if video is None:
+        return None
+    audio = None if _has_audio(video) else _best_audio(formats, audio_ranks)
+    picked = [f for f in (video, audio) if f is not None]
+    sizes = [estimate_size(f, duration) for f in picked]
+    return {
+        "format": "+".join(f["format_id"] for f in picked),
+        "video": video,
+        "audio": audio,
+        "height": video["height"],
+        "size": sum(sizes) if None not in sizes else None,
+    }
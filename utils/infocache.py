@@ -0,0 +1,81 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_INFO_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ytdownloader", "info.sqlite3")
+# Stream URLs inside an info dict expire after a few hours on YouTube, so
+# entries must be refreshed well before that.
+DEFAULT_INFO_TTL = 30 * 60
+
+
+def video_key(url):
+    """Return "<extractor>:<video id>" for url without any network access.
+
+    None when no specific extractor recognises the URL, in which case the
+    result should not be cached.
+    """
+    import yt_dlp  # Deferred so front-ends can show their window first
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == "Generic" or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        return f"{ie.ie_key()}:{video_id}" if video_id else None
+    return None
+
+
+class InfoCache:
+    """SQLite cache of raw yt-dlp extraction results with a TTL.
+
+    Values are the unprocessed info dicts from extract_info(process=False),
+    so format selection still runs for every job and different qualities of
+    the same video share one entry.
+    """
+
+    def __init__(self, db_path=DEFAULT_INFO_CACHE_PATH, ttl=DEFAULT_INFO_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, fetched REAL, info TEXT)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across workers.
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:  # Commits on success
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key):
+        """Return the cached info dict for key if it is still fresh, else None."""
+        with self._connect() as db:
+            row = db.execute("SELECT fetched, info FROM info WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None or time.time() - row[0] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, key, info):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO info (key, fetched, info) VALUES (?, ?, ?)",
+                       (key, time.time(), json.dumps(info)))
+
+    def prune(self):
+        """Delete expired entries."""
+        with self._connect() as db:
+            db.execute("DELETE FROM info WHERE fetched < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,592 @@
+import glob
+import os
+import re
+import shutil
+from contextlib import nullcontext
+from utils.trimmer import trim_args, time_to_seconds, clip_sources, smart_cut
+from utils.conversion import Converter, probe_media
+from utils.binaries import ffmpeg_path
+from utils.formatparser import get_format_option, resolve_format
+from utils.audio import AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT, audio_format_for_name, can_copy, extract_audio
+from utils.clips import cut_clips
+from utils.profiles import DEFAULT_PROFILE
+from utils.cancel import CancelToken, JobCancelled
+from utils.progress import download_event
+from utils.cache import MediaCache
+from utils.infocache import InfoCache, video_key
+from utils.ydlpool import YoutubeDLPool
+from utils.ratelimit import RateLimits, host_of, retry_sleep
+from utils.failures import JobFailed, RETRY_POLICIES, THROTTLED, classify
+from utils.metrics import Metrics
+
+vidConverter = Converter()
+
+# Shared MediaCache, or None to always fetch from the network. Front-ends
+# turn it on with enable_media_cache().
+media_cache = None
+# Shared InfoCache, or None to extract every URL afresh (enable_info_cache()).
+info_cache = None
+# Shared YoutubeDLPool, or None for a fresh YoutubeDL per job (enable_ydl_pool()).
+ydl_pool = None
+# Shared RateLimits, or None for no bandwidth or per-site limits (enable_rate_limits()).
+rate_limits = None
+# Shared Metrics, or None to record no timing spans (enable_metrics()).
+metrics = None
+
+# Trim modes for partial downloads: "smart" fetches only the byte ranges of
+# the window and re-encodes just the partial GOPs at its ends, "reencode" is
+# the original ffmpeg external downloader that transcodes the whole clip.
+TRIM_MODES = ("smart", "reencode")
+
+# Fragments of a DASH/HLS format fetched in parallel when the job does not
+# say otherwise; the ConnectionBudget may grant fewer.
+DEFAULT_FRAGMENTS = 4
+
+
+class DownloadJob:
+    """Everything needed to download (and optionally trim) one video.
+
+    This holds plain values only so it can be built by any front-end and run
+    on a worker thread without touching widgets.
+    """
+
+    def __init__(self, url, folder, name, quality, start=None, end=None, trim_mode="smart",
+                 profile=DEFAULT_PROFILE, target_seconds=None, fragments=DEFAULT_FRAGMENTS, audio_format=None,
+                 clips=None):
+        self.url = url
+        self.folder = folder
+        self.name = name or "input"
+        self.quality = quality
+        self.start = start
+        self.end = end
+        self.trim_mode = trim_mode
+        # Encode profile name (see utils.profiles) and, for "auto", the
+        # turnaround time the encode should fit in.
+        self.profile = profile
+        self.target_seconds = target_seconds
+        # Output format of audio-only jobs (see utils.audio); a name ending
+        # in .wav, .mp3, ... picks it too.
+        self.audio_format = audio_format or audio_format_for_name(self.name) or DEFAULT_AUDIO_FORMAT
+        # Clip list: (start, end, name) windows cut from the one full
+        # download by convert() instead of converting it (see utils.clips).
+        self.clips = [tuple(clip) for clip in clips] if clips else []
+        # Wanted fragment concurrency; connections is what download() got
+        # from the budget.
+        self.fragments = fragments
+        self.connections = fragments
+        self.cancel_token = CancelToken()
+        # on_progress(job, event) receives events from utils.progress; set
+        # by the front-end, usually wrapped in a ProgressThrottle.
+        self.on_progress = None
+        # Filled in by download() once the format is resolved.
+        self.resolved_format = None
+        self.expected_bytes = None
+        # Exact path of the finished download, as reported by yt-dlp; this
+        # is what convert() reads.
+        self.downloaded_file = None
+        # Failure class (see utils.failures) once a stage has failed for good.
+        self.failure = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def cancel(self):
+        """Stop this job's download/conversion as soon as possible."""
+        self.cancel_token.cancel()
+
+    def report_progress(self, event):
+        if self.on_progress is not None:
+            self.on_progress(self, event)
+
+    def _download_progress(self, d):
+        self.report_progress(download_event(d))
+
+    def _postprocessor_hook(self, d):
+        # Post-processors run in order and MoveFiles comes last, so the final
+        # "finished" call carries the path of the merged/moved file.
+        self.cancel_token.progress_hook(d)
+        if metrics is not None:
+            metrics.postprocessor_hook(self, d)
+        filepath = (d.get("info_dict") or {}).get("filepath")
+        if d.get("status") == "finished" and filepath:
+            self.downloaded_file = filepath
+
+    @property
+    def is_audio_only(self):
+        return self.quality == "audio-only"
+
+    @property
+    def is_partial(self):
+        # A clip list fetches the whole source; its windows are cut afterwards.
+        return bool(self.start and self.end) and not self.clips
+
+    @property
+    def uses_external_trim(self):
+        # Audio clips always go through extract_audio, which fetches only the window.
+        return self.is_partial and self.trim_mode == "reencode" and not self.is_audio_only
+
+    @property
+    def output_name(self):
+        if self.is_audio_only:
+            # Ensure the output name ends with the audio format's extension
+            ext = AUDIO_FORMATS[self.audio_format]["ext"]
+            return self.name if self.name.lower().endswith(ext) else self.name + ext
+        return self.name if self.name.lower().endswith(".mp4") else self.name + ".mp4"
+
+    def build_opts(self):
+        opts = {
+            "outtmpl": os.path.join(self.folder, self.output_name),
+            "format": get_format_option(self.quality),
+            "merge_output_format": "mp4",
+            # Pick up .part files left by an interrupted run where they stopped.
+            "continuedl": True,
+            # Checked on every downloaded chunk and around post-processing.
+            "progress_hooks": [self.cancel_token.progress_hook, self._download_progress],
+            "postprocessor_hooks": [self._postprocessor_hook],
+            # Fragmented (DASH/HLS) formats are fetched over this many connections.
+            "concurrent_fragment_downloads": self.connections,
+            # Merging DASH formats and HLS downloads need ffmpeg; use the bundled one.
+            "ffmpeg_location": ffmpeg_path(),
+        }
+        if rate_limits is not None:
+            # Charge every byte and fragment request to the shared limits,
+            # and space yt-dlp's own retries out instead of hammering.
+            opts["progress_hooks"].append(rate_limits.progress_hook(host_of(self.url), self.cancel_token))
+            opts["retry_sleep_functions"] = {"http": retry_sleep, "fragment": retry_sleep, "extractor": retry_sleep}
+        if self.uses_external_trim:
+            opts["external_downloader"] = ffmpeg_path()
+            opts["external_downloader_args"] = trim_args(self.start, self.end, self.profile, self.target_seconds)
+        return opts
+
+    def describe(self):
+        """Return a string with the job's fields, used for error dumps."""
+        state = [
+            "URL: " + self.url,
+            "Folder: " + self.folder,
+            "Download Name: " + self.name,
+            "Quality: " + self.quality,
+            "Partial: " + str(self.is_partial),
+        ]
+        if self.is_partial:
+            state.append("From: " + self.start)
+            state.append("To: " + self.end)
+        for start, end, name in self.clips:
+            state.append(f"Clip: {start}-{end} {name}")
+        if self.failure:
+            state.append("Failure: " + self.failure)
+        return "\n".join(state)
+
+
+def enable_media_cache(cache_dir=None, max_bytes=None):
+    global media_cache
+    kwargs = {}
+    if cache_dir:
+        kwargs["cache_dir"] = cache_dir
+    if max_bytes:
+        kwargs["max_bytes"] = max_bytes
+    media_cache = MediaCache(**kwargs)
+    return media_cache
+
+
+def enable_info_cache(db_path=None, ttl=None):
+    global info_cache
+    kwargs = {}
+    if db_path:
+        kwargs["db_path"] = db_path
+    if ttl:
+        kwargs["ttl"] = ttl
+    info_cache = InfoCache(**kwargs)
+    info_cache.prune()
+    return info_cache
+
+
+def enable_rate_limits(bandwidth=None, schedule=None, host_connections=None, host_requests=None):
+    """Share one bandwidth budget and per-site limits among all downloads.
+
+    bandwidth is in bytes per second and schedule a list of windows from
+    utils.ratelimit.parse_schedule; both can be changed later through
+    rate_limits.bandwidth.
+    """
+    global rate_limits
+    rate_limits = RateLimits(bandwidth, schedule, host_connections, host_requests)
+    return rate_limits
+
+
+def enable_metrics(path=None, port=None):
+    """Record timing spans of every job stage (see utils.metrics).
+
+    Spans are appended to the JSON-lines file path; with port the
+    counters are also served for Prometheus on localhost.
+    """
+    global metrics
+    metrics = Metrics(path)
+    if port:
+        metrics.serve(port)
+    return metrics
+
+
+def span(job, name, **fields):
+    """metrics.span() when metrics are enabled; otherwise just yields fields."""
+    return metrics.span(job, name, **fields) if metrics is not None else nullcontext(fields)
+
+
+def _file_size(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else None
+
+
+def enable_ydl_pool(base_opts=None):
+    global ydl_pool
+    ydl_pool = YoutubeDLPool(base_opts)
+    return ydl_pool
+
+
+def _youtube_dl(opts):
+    """YoutubeDL for one job: the worker's pooled instance when enabled."""
+    _point_ytdlp_at_ffmpeg(opts["ffmpeg_location"])
+    if ydl_pool is not None:
+        return ydl_pool.session(opts)
+    import yt_dlp  # Deferred so front-ends can show their window first
+    return yt_dlp.YoutubeDL(opts)
+
+
+def _point_ytdlp_at_ffmpeg(location):
+    """Make yt-dlp's ffmpeg downloader find the bundled binary too.
+
+    Whether FFmpegFD can run is decided without the YoutubeDL params, from
+    a context variable only yt-dlp's command line sets (--ffmpeg-location),
+    so without this the reencode trim silently falls back to fetching the
+    whole file. Context variables are per thread: set it in every worker.
+    """
+    from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+    location_var = getattr(FFmpegPostProcessor, "_ffmpeg_location", None)
+    if location_var is not None:
+        location_var.set(location)
+
+
+def extract_raw(ydl, url):
+    """Return the unprocessed info dict for url.
+
+    With an info cache, a fresh extraction result is reused and the page,
+    player and format list are not fetched again.
+    """
+    key = video_key(url) if info_cache is not None else None
+    raw = info_cache.get(key) if key is not None else None
+    if raw is None:
+        raw = ydl.extract_info(url, download=False, process=False)
+        # Playlists hold lazy entries that cannot be stored.
+        if key is not None and raw.get("_type", "video") == "video":
+            raw = ydl.sanitize_info(raw, remove_private_keys=True)
+            info_cache.put(key, raw)
+    return raw
+
+
+def select_format(ydl, raw, job):
+    """Resolve job's quality against the real format list and point ydl at it.
+
+    Falls back to the static get_format_option selector when the result has
+    no usable format list (e.g. playlists). Records the resolved format id
+    and expected size on the job.
+    """
+    ranks = AUDIO_FORMATS[job.audio_format].get("ranks") if job.is_audio_only else None
+    resolution = resolve_format(raw.get("formats") or [], job.quality, raw.get("duration"), ranks)
+    if resolution is None:
+        return None
+    ydl.format_selector = ydl.build_format_selector(resolution["format"])
+    size = resolution["size"]
+    if size and job.is_partial and raw.get("duration"):
+        window = time_to_seconds(job.end) - time_to_seconds(job.start)
+        size = int(size * min(1, window / raw["duration"]))
+    job.resolved_format = resolution["format"]
+    job.expected_bytes = size
+    return resolution
+
+
+def check_disk_space(job):
+    if not job.expected_bytes:
+        return
+    free = shutil.disk_usage(job.folder).free
+    if free < job.expected_bytes:
+        raise RuntimeError(f"Not enough disk space for {job.output_name}: "
+                           f"needs ~{job.expected_bytes // 2**20} MiB, {free // 2**20} MiB free")
+
+
+def _cache_key(info):
+    return f"{info.get('extractor_key', 'generic')}-{info['id']}", info.get("format_id", "best")
+
+
+def cleanup_partial_files(job):
+    """Remove yt-dlp leftovers (.part, .ytdl, .fNNN streams) and the unfinished output."""
+    destination = os.path.join(job.folder, job.output_name)
+    base = os.path.splitext(destination)[0]
+    for path in glob.glob(glob.escape(base) + ".*"):
+        name = os.path.basename(path)
+        if path == destination or name.endswith((".part", ".ytdl")) or re.search(r"\.f[\w-]+\.\w+$", name):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def download(job, connections=None):
+    """Fetch job's media into its folder; raises JobCancelled when cancelled.
+
+    Returns the path of the downloaded file (also kept as job.downloaded_file).
+
+    connections is an optional utils.scheduler.ConnectionBudget shared by
+    all running downloads; the job's fragment concurrency is capped by
+    what it grants. With rate limits enabled the job also waits for its
+    site's connection and request allowance. Failures are retried
+    (resuming the .part files) as their class's policy allows, see
+    with_retries(); a 403/429 answer also puts the site in a cooldown.
+    """
+    host = host_of(job.url)
+    job.failure = None
+    path = with_retries(job, "download", lambda: _fetch(job, connections, host), host)
+    if rate_limits is not None:
+        rate_limits.hosts.succeeded(host)
+    return path
+
+
+def with_retries(job, stage, work, host=None):
+    """Run work() and retry it by the RETRY_POLICIES of its failure class.
+
+    Transient failures are retried after a jittered backoff; once the
+    policy is used up, or for failures a retry cannot fix, JobFailed is
+    raised and job.failure names the class. JobCancelled passes through.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return work()
+        except JobCancelled:
+            raise
+        except Exception as e:
+            if job.cancel_token.wait(retry_delay(job, stage, e, attempt, host)):
+                raise JobCancelled() from e
+
+
+def retry_delay(job, stage, error, attempt, host=None):
+    """Seconds to wait before retrying stage after error ended attempt number attempt.
+
+    Raises JobFailed (and sets job.failure) when the failure class allows
+    no further attempt. Shared by with_retries and utils.engine.
+    """
+    failure = classify(error)
+    policy = RETRY_POLICIES[failure]
+    if attempt >= policy.attempts:
+        job.failure = failure
+        raise JobFailed(failure, stage, error, attempt) from error
+    delay = policy.delay(attempt)
+    if failure == THROTTLED and rate_limits is not None and host is not None:
+        # Every job of the site waits for the cooldown, not just this one.
+        delay = max(delay, rate_limits.hosts.penalize(host))
+    print(f"🔁 {job.output_name}: {stage} failed ({failure}); retrying in ~{delay:.0f}s "
+          f"({attempt}/{policy.attempts - 1})")
+    return delay
+
+
+def _fetch(job, connections, host):
+    job.cancel_token.check()
+    limits = rate_limits
+    if limits is not None:
+        # Waits out the site's cooldown after a 403/429 as well.
+        limits.hosts.request(host, job.cancel_token)
+    # The site's share first, so a job waiting for a busy site holds no
+    # connections of the global budget meanwhile.
+    host_grant = limits.hosts.acquire(host, job.fragments) if limits is not None else job.fragments
+    try:
+        grant = connections.acquire(host_grant) if connections is not None else host_grant
+        job.connections = grant
+        job.downloaded_file = None
+        try:
+            with _youtube_dl(job.build_opts()) as ydl:
+                _download(job, ydl)
+        except Exception as e:
+            # yt-dlp may wrap the JobCancelled raised by our hooks.
+            if job.cancelled:
+                cleanup_partial_files(job)
+                raise JobCancelled() from e
+            raise
+        finally:
+            if connections is not None:
+                connections.release(grant)
+    finally:
+        if limits is not None:
+            limits.hosts.release(host, host_grant)
+    if job.downloaded_file is None:
+        raise RuntimeError("yt-dlp did not report a file for " + job.output_name)
+    return job.downloaded_file
+
+
+def _download(job, ydl):
+    if job.uses_external_trim:
+        with span(job, "download", external_trim=True) as fields:
+            ydl.download([job.url])
+            fields["bytes"] = _file_size(job.downloaded_file)
+        return
+
+    # Resolve the formats first so the cache and free space can be
+    # checked before any media is fetched.
+    with span(job, "extract"):
+        raw = extract_raw(ydl, job.url)
+    with span(job, "format") as fields:
+        resolved = select_format(ydl, raw, job)
+        fields.update(format=job.resolved_format, expected_bytes=job.expected_bytes)
+    if resolved is not None:
+        size = f"~{job.expected_bytes / 2**20:.1f} MiB" if job.expected_bytes else "unknown size"
+        print(f"📦 {job.output_name}: format {job.resolved_format}, {size}, {job.connections} connection(s)")
+    check_disk_space(job)
+    info = ydl.process_ie_result(raw, download=False)
+    destination = os.path.join(job.folder, job.output_name)
+    cached = media_cache.lookup(*_cache_key(info)) if media_cache is not None else None
+
+    with span(job, "download", cached=cached is not None, connections=job.connections) as fields:
+        _fetch_media(job, ydl, info, destination, cached)
+        fields["bytes"] = _file_size(job.downloaded_file)
+
+
+def _fetch_media(job, ydl, info, destination, cached):
+    if job.is_audio_only:
+        _download_audio(job, ydl, info, destination, cached)
+    elif job.is_partial:
+        video, audio = clip_sources(info)
+        if cached is not None:
+            # Cut from the cached source instead of the remote URLs.
+            video = video and {"url": cached, "vcodec": video.get("vcodec")}
+            audio = audio and {"url": cached}
+        # ffmpeg reads only the window from the sources itself.
+        smart_cut(video, audio, destination, time_to_seconds(job.start), time_to_seconds(job.end),
+                  profile=job.profile, target_seconds=job.target_seconds, cancel_token=job.cancel_token,
+                  on_progress=job.report_progress)
+        job.downloaded_file = destination
+    elif cached is not None:
+        with span(job, "write", source="cache") as fields:
+            shutil.copyfile(cached, destination)
+            fields["bytes"] = _file_size(destination)
+        job.downloaded_file = destination
+    else:
+        ydl.process_ie_result(info, download=True)
+        _store_in_cache(job, info)
+
+
+def _store_in_cache(job, info):
+    if media_cache is not None and job.downloaded_file:
+        with span(job, "write", target="cache") as fields:
+            media_cache.store(*_cache_key(info), job.downloaded_file)
+            fields["bytes"] = _file_size(job.downloaded_file)
+
+
+def _download_audio(job, ydl, info, destination, cached):
+    """Fetch only the audio stream into job's audio format.
+
+    A full-length download whose stream already is the target container
+    (AAC in .m4a) is written by yt-dlp itself; everything else, clips
+    included, goes through one ffmpeg that reads the stream URL and writes
+    the output with no intermediate file.
+    """
+    _, audio = clip_sources(info)
+    if audio is None:
+        _extract_from_download(job, ydl, info, destination, cached)
+        return
+    native = (not job.is_partial and cached is None and can_copy(audio.get("acodec"), job.audio_format)
+              and "." + (info.get("ext") or "") == AUDIO_FORMATS[job.audio_format]["ext"])
+    if native:
+        ydl.process_ie_result(info, download=True)
+        _store_in_cache(job, info)
+        return
+    if cached is not None:
+        audio = {"url": cached, "acodec": audio.get("acodec")}
+    start = time_to_seconds(job.start) if job.is_partial else None
+    end = time_to_seconds(job.end) if job.is_partial else None
+    extract_audio(audio, destination, job.audio_format, start, end, info.get("duration"),
+                  job.cancel_token, job.report_progress)
+    job.downloaded_file = destination
+
+
+def _extract_from_download(job, ydl, info, destination, cached):
+    """Audio of a source whose format says it has none, checked on the file itself.
+
+    yt-dlp fetches the source (unless it is cached) and the audio is
+    extracted from that local copy, which is removed afterwards.
+    """
+    source = cached
+    if source is None:
+        ydl.process_ie_result(info, download=True)
+        if not job.downloaded_file:
+            raise RuntimeError("yt-dlp did not report a file for " + job.output_name)
+        # yt-dlp wrote to the output name; keep the source aside while extracting.
+        source = destination + ".source"
+        os.replace(job.downloaded_file, source)
+    try:
+        if probe_media(source)["audio"] is None:
+            raise RuntimeError("No audio stream found for " + job.output_name)
+        start = time_to_seconds(job.start) if job.is_partial else None
+        end = time_to_seconds(job.end) if job.is_partial else None
+        extract_audio({"url": source}, destination, job.audio_format, start, end, info.get("duration"),
+                      job.cancel_token, job.report_progress)
+    finally:
+        if source != cached and os.path.exists(source):
+            os.remove(source)
+    job.downloaded_file = destination
+
+
+def needs_conversion(job):
+    """Whether job has a convert stage after its download (audio-only jobs only for clip lists)."""
+    return not job.is_audio_only or bool(job.clips)
+
+
+def submit_job(pipeline, job, deletesOriginal=False):
+    """Queue job's download and, when it needs one, its conversion on a scheduler.Pipeline."""
+    convert_work = None
+    if needs_conversion(job):
+        convert_work = lambda: convert(job, deletesOriginal, pipeline.conversion_threads())
+    pipeline.submit(job, lambda: download(job, pipeline.connections), convert_work)
+
+
+def convert(job, deletesOriginal=False, threads=None):
+    """Convert the downloaded file to MP4; audio-only jobs are left as they are.
+
+    A clip list job instead has all its clips cut from the downloaded
+    source, which is kept for further cuts.
+    threads caps ffmpeg's encoder threads, see Pipeline.conversion_threads.
+    """
+    job.cancel_token.check()
+    return with_retries(job, "conversion", lambda: _convert(job, deletesOriginal, threads))
+
+
+def _convert(job, deletesOriginal, threads):
+    if not needs_conversion(job):
+        return None
+    with span(job, "convert", threads=threads) as fields:
+        on_progress = conversion_probe(job, fields)
+        if job.clips:
+            cut_clips(job.downloaded_file, job.clips, job.folder, job.trim_mode, job.profile, job.target_seconds,
+                      job.audio_format if job.is_audio_only else None, job.cancel_token, on_progress, threads)
+            fields["mode"] = "clips"
+            return "clips"
+        mode = vidConverter.convert_webm_to_mp4(job.downloaded_file, job.folder, job.output_name, deletesOriginal,
+                                                job.profile, job.target_seconds, job.cancel_token,
+                                                on_progress=on_progress, threads=threads)
+        if mode is None:
+            raise RuntimeError("Conversion failed for " + job.output_name)
+        fields["mode"] = mode
+        return mode
+
+
+def conversion_probe(job, fields):
+    """job.report_progress that also keeps the encode's media time and fps in a span's fields."""
+    def on_progress(event):
+        if event.get("out_time"):
+            fields["media_seconds"] = event["out_time"]
+        if event.get("fps"):
+            fields["fps"] = event["fps"]
+        job.report_progress(event)
+    return on_progress
+
+
+def run_job(job):
+    """Download then convert one job in a single step (no pipelining)."""
+    download(job)
+    return convert(job)
@@ -0,0 +1,144 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from utils.jobs import DownloadJob
+from utils.scheduler import FINISHED, FAILED, CANCELLED
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ytdownloader", "journal.sqlite3")
+# Jobs in these states are not picked up again after a restart.
+DONE_STATES = (FINISHED, FAILED, CANCELLED)
+# DownloadJob attributes needed to rebuild a job after a restart.
+JOB_FIELDS = ("url", "folder", "name", "quality", "start", "end", "trim_mode", "profile",
+              "target_seconds", "fragments", "audio_format", "clips")
+
+
+def job_key(job):
+    """Stable id of a job: same URL, output file and clip window(s) -> same key."""
+    parts = [job.url, os.path.abspath(job.folder), job.output_name, job.quality, job.start or "", job.end or ""]
+    if job.clips:
+        parts.append(json.dumps(job.clips))
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def job_spec(job):
+    return {field: getattr(job, field) for field in JOB_FIELDS}
+
+
+def job_from_spec(spec):
+    spec = {field: spec.get(field) for field in JOB_FIELDS if spec.get(field) is not None}
+    return DownloadJob(**spec)
+
+
+class JobJournal:
+    """Crash-safe SQLite record of every job's state transitions.
+
+    Each transition is written (and committed) from the worker thread the
+    moment it happens, together with the .part/.fNNN files the download is
+    writing, so after a crash the journal knows which jobs finished and which
+    were cut off. unfinished() rebuilds the latter; yt-dlp then continues
+    their .part files from where they stopped (continuedl) instead of
+    starting over, and finished jobs can be skipped with is_finished().
+    """
+
+    def __init__(self, db_path=DEFAULT_JOURNAL_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Partial files already written per job key, so chunks do not hit SQLite.
+        self._seen_files = {}
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, spec TEXT, state TEXT, "
+                       "detail TEXT, partial_files TEXT, updated REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS transitions (key TEXT, state TEXT, time REAL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across workers.
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:  # Commits on success
+                yield db
+        finally:
+            db.close()
+
+    def record(self, job, state, detail=None):
+        """Store job's new state; the job row is created on first sight."""
+        key = job_key(job)
+        now = time.time()
+        detail = detail if isinstance(detail, str) else None
+        with self._connect() as db:
+            db.execute("INSERT INTO transitions (key, state, time) VALUES (?, ?, ?)", (key, state, now))
+            db.execute("INSERT INTO jobs (key, spec, state, detail, partial_files, updated) "
+                       "VALUES (?, ?, ?, ?, '[]', ?) ON CONFLICT(key) DO UPDATE SET "
+                       "spec = excluded.spec, state = excluded.state, detail = excluded.detail, "
+                       "updated = excluded.updated",
+                       (key, json.dumps(job_spec(job)), state, detail, now))
+            if state == FINISHED:
+                db.execute("UPDATE jobs SET partial_files = '[]' WHERE key = ?", (key,))
+        if state in DONE_STATES:
+            with self._lock:
+                self._seen_files.pop(key, None)
+
+    def progress(self, job, event):
+        """Progress callback (see utils.progress) recording partial file paths."""
+        path = event.get("filename")
+        if not path or event.get("stage") != "download":
+            return
+        key = job_key(job)
+        with self._lock:
+            seen = self._seen_files.setdefault(key, set())
+            if path in seen:
+                return
+            seen.add(path)
+            files = sorted(seen)
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET partial_files = ? WHERE key = ?", (json.dumps(files), key))
+
+    def tracking(self, on_state, job_of=None):
+        """Wrap a Pipeline on_state callback so every transition is journaled.
+
+        job_of maps the pipeline key to its DownloadJob when the key is not
+        the job itself.
+        """
+        def record_state(key, state, detail=None):
+            job = job_of(key) if job_of is not None else key
+            if job is not None:
+                self.record(job, state, detail)
+            if on_state is not None:
+                on_state(key, state, detail)
+        return record_state
+
+    def state(self, job):
+        with self._connect() as db:
+            row = db.execute("SELECT state FROM jobs WHERE key = ?", (job_key(job),)).fetchone()
+        return row[0] if row else None
+
+    def is_finished(self, job):
+        """True when job finished before and its output file is still there."""
+        return (self.state(job) == FINISHED
+                and os.path.exists(os.path.join(job.folder, job.output_name)))
+
+    def unfinished(self):
+        """Rebuild the jobs that were queued or running when the process stopped.
+
+        Returns (job, partial_files) pairs, oldest first.
+        """
+        placeholders = ", ".join("?" for _ in DONE_STATES)
+        with self._connect() as db:
+            rows = db.execute(f"SELECT spec, partial_files FROM jobs WHERE state NOT IN ({placeholders}) "
+                              "ORDER BY updated", DONE_STATES).fetchall()
+        return [(job_from_spec(json.loads(spec)), json.loads(files)) for spec, files in rows]
+
+    def forget(self, job):
+        """Drop job from the journal, e.g. when its card is deleted."""
+        key = job_key(job)
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+            db.execute("DELETE FROM transitions WHERE key = ?", (key,))
+        with self._lock:
+            self._seen_files.pop(key, None)
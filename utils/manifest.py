@@ -0,0 +1,83 @@
+import csv
+import json
+import os
+from utils.jobs import DownloadJob
+from utils.audio import AUDIO_FORMATS
+from utils.trimmer import time_to_seconds
+
+MANIFEST_FIELDS = ("url", "name", "quality", "start", "end", "audio_format")
+
+
+def _field(row, key, default=None):
+    """row[key] as a stripped string; JSON numbers such as "start": 30 are accepted."""
+    value = row.get(key)
+    if value is None:
+        return default
+    return str(value).strip() or default
+
+
+def _row_to_job(row, folder, default_quality, number):
+    if not isinstance(row, dict):
+        raise ValueError("expected an object with a url")
+    url = _field(row, "url")
+    if not url:
+        return None
+    audio_format = _field(row, "audio_format")
+    if audio_format is not None and audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"audio_format {audio_format!r} is not one of {', '.join(AUDIO_FORMATS)}")
+    start, end = _field(row, "start"), _field(row, "end")
+    if bool(start) != bool(end):
+        raise ValueError("start and end must be given together")
+    if start:
+        try:
+            window = time_to_seconds(end) - time_to_seconds(start)
+        except ValueError:
+            raise ValueError("bad time") from None
+        if window <= 0:
+            raise ValueError("clip ends before it starts")
+    return DownloadJob(
+        url,
+        _field(row, "folder", folder),
+        # Unnamed rows are numbered so they do not all write to input.mp4.
+        _field(row, "name", f"row{number}"),
+        _field(row, "quality", default_quality),
+        start,
+        end,
+        audio_format=audio_format,
+    )
+
+
+def load_manifest(path, folder, default_quality="1080p"):
+    """Read a CSV or JSONL manifest into DownloadJobs.
+
+    Every row carries url, name, quality, start and end (only url is
+    required); an optional folder column overrides the output directory and
+    audio_format picks the output of audio-only rows (m4a, opus, mp3, ...).
+    CSV files need a header row. Rows without a url are skipped, rows
+    without a name are named after their line ("row12"). Raises ValueError
+    naming the line of a bad row or of a second row with the same output
+    file.
+    """
+    jobs = []
+    outputs = {}
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if path.lower().endswith((".jsonl", ".json")):
+            rows = ((number, line) for number, line in enumerate(file, 1) if line.strip())
+            parse = json.loads
+        else:
+            reader = csv.DictReader(file)
+            rows = ((reader.line_num, row) for row in reader)
+            parse = None
+        for number, row in rows:
+            try:
+                job = _row_to_job(parse(row) if parse else row, folder, default_quality, number)
+            except ValueError as e:
+                raise ValueError(f"{path} line {number}: {e}") from None
+            if job is None:
+                continue
+            output = os.path.normcase(os.path.abspath(os.path.join(job.folder, job.output_name)))
+            if output in outputs:
+                raise ValueError(f"{path} line {number}: writes {job.output_name} like line {outputs[output]}")
+            outputs[output] = number
+            jobs.append(job)
+    return jobs
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.cancel import JobCancelled
+from utils.scheduler import FINISHED, FAILED, CANCELLED
+
+# yt-dlp post-processors (pp_key) timed as spans of their own.
+POSTPROCESSOR_SPANS = {"Merger": "merge", "MoveFiles": "write"}
+
+
+class Metrics:
+    """Per-job timing spans of every pipeline stage.
+
+    A span is one timed stage of one job: "extract", "format", "download",
+    "merge", "write" (moving the result into place, cache copies) and
+    "convert". Each is written to path as one JSON line with its duration,
+    outcome ("ok", "error", "cancelled") and stage fields, and summed into
+    the counters render() exposes in the Prometheus text format. Spans can
+    nest: yt-dlp merges and moves the file inside the download span.
+    """
+
+    def __init__(self, path=None):
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self._lock = threading.Lock()
+        # (span, status) -> [count, seconds]
+        self._spans = {}
+        self._last = {}
+        self._bytes = {}
+        self._media_seconds = 0.0
+        # (state, failure) -> count of jobs that ended that way
+        self._jobs = {}
+        self._open = {}
+        self._server = None
+
+    @contextmanager
+    def span(self, job, name, **fields):
+        """Time the with-block as span name of job.
+
+        The yielded dict holds the span's fields; the block may add to it
+        ("bytes", "media_seconds", "fps", ...). Throughput and the speed
+        factor are derived from those when the span ends.
+        """
+        start = time.monotonic()
+        status = "ok"
+        try:
+            yield fields
+        except JobCancelled:
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record(job, name, time.monotonic() - start, status, fields)
+
+    def record(self, job, name, seconds, status="ok", fields=None):
+        fields = dict(fields or {})
+        if fields.get("bytes") and seconds > 0:
+            fields["bytes_per_second"] = fields["bytes"] / seconds
+        if fields.get("media_seconds") and seconds > 0:
+            fields["speed_factor"] = fields["media_seconds"] / seconds
+        with self._lock:
+            totals = self._spans.setdefault((name, status), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            if status == "ok":
+                self._last[name] = seconds
+                if fields.get("bytes"):
+                    self._bytes[name] = self._bytes.get(name, 0) + fields["bytes"]
+                if name == "convert" and fields.get("media_seconds"):
+                    self._media_seconds += fields["media_seconds"]
+        self._write(dict(fields, kind="span", span=name, seconds=round(seconds, 3), status=status,
+                         job=job.output_name, url=job.url))
+
+    def postprocessor_hook(self, job, d):
+        """Feed yt-dlp postprocessor hook calls; times the POSTPROCESSOR_SPANS."""
+        name = POSTPROCESSOR_SPANS.get(d.get("postprocessor"))
+        if name is None:
+            return
+        key = (id(job), name)
+        if d.get("status") == "started":
+            with self._lock:
+                self._open[key] = time.monotonic()
+        elif d.get("status") == "finished":
+            with self._lock:
+                start = self._open.pop(key, None)
+            if start is not None:
+                self.record(job, name, time.monotonic() - start)
+
+    def tracking(self, on_state):
+        """Wrap a Pipeline on_state callback so finished jobs are counted."""
+        def record_state(job, state, detail=None):
+            if state in (FINISHED, FAILED, CANCELLED):
+                failure = getattr(job, "failure", None) if state == FAILED else None
+                with self._lock:
+                    self._jobs[(state, failure)] = self._jobs.get((state, failure), 0) + 1
+                self._write({"kind": "job", "state": state, "failure": failure,
+                             "job": job.output_name, "url": job.url})
+            if on_state is not None:
+                on_state(job, state, detail)
+        return record_state
+
+    def render(self):
+        """The counters in the Prometheus text exposition format."""
+        with self._lock:
+            lines = ["# HELP ytdl_span_seconds_total Wall time spent in pipeline stages.",
+                     "# TYPE ytdl_span_seconds_total counter"]
+            lines += [f'ytdl_span_seconds_total{{span="{span}",status="{status}"}} {seconds:.3f}'
+                      for (span, status), (_, seconds) in sorted(self._spans.items())]
+            lines += ["# HELP ytdl_spans_total Pipeline stages run.", "# TYPE ytdl_spans_total counter"]
+            lines += [f'ytdl_spans_total{{span="{span}",status="{status}"}} {count}'
+                      for (span, status), (count, _) in sorted(self._spans.items())]
+            lines += ["# HELP ytdl_span_last_seconds Duration of the latest successful span.",
+                      "# TYPE ytdl_span_last_seconds gauge"]
+            lines += [f'ytdl_span_last_seconds{{span="{span}"}} {seconds:.3f}'
+                      for span, seconds in sorted(self._last.items())]
+            lines += ["# HELP ytdl_bytes_total Bytes fetched or written by successful spans.",
+                      "# TYPE ytdl_bytes_total counter"]
+            lines += [f'ytdl_bytes_total{{span="{span}"}} {count}' for span, count in sorted(self._bytes.items())]
+            lines += ["# HELP ytdl_converted_media_seconds_total Media duration converted.",
+                      "# TYPE ytdl_converted_media_seconds_total counter",
+                      f"ytdl_converted_media_seconds_total {self._media_seconds:.3f}"]
+            lines += ["# HELP ytdl_jobs_total Jobs by final state and failure class.",
+                      "# TYPE ytdl_jobs_total counter"]
+            lines += [f'ytdl_jobs_total{{state="{state}",failure="{failure or ""}"}} {count}'
+                      for (state, failure), count in sorted(self._jobs.items(), key=lambda item: str(item[0]))]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Expose render() at http://host:port/metrics on a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would drown the download output
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        print(f"📈 Metrics on http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, record):
+        record["time"] = time.time()
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
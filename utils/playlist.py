@@ -0,0 +1,140 @@
+import threading
+from utils.cancel import CancelToken
+from utils.jobs import DownloadJob
+
+# Channels list their tabs, tabs list playlists...; deeper nesting is ignored.
+MAX_DEPTH = 3
+# DownloadJob settings an entry inherits from the job that named the playlist.
+INHERITED_FIELDS = ("start", "end", "trim_mode", "profile", "target_seconds", "fragments", "audio_format")
+
+
+def is_playlist(url):
+    """True when the extractor for url says it lists several videos.
+
+    Decided from the URL alone (no network access); unknown URLs are
+    treated as single videos.
+    """
+    import yt_dlp  # Deferred so front-ends can show their window first
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == "Generic" or not ie.suitable(url):
+            continue
+        return ie.is_single_video(url) is False
+    return False
+
+
+def iter_entries(url, cancel_token=None, ydl=None, _depth=0):
+    """Yield {"url", "id", "title"} for every video of a playlist or channel as it is listed.
+
+    The listing is extracted flat and unprocessed, so pages are fetched
+    only as the generator is consumed and no per-entry info dict is kept:
+    a 5,000 entry playlist yields its first entries after one page request
+    and memory does not grow with its length.
+    """
+    if ydl is None:
+        import yt_dlp  # Deferred so front-ends can show their window first
+        with yt_dlp.YoutubeDL({"extract_flat": "in_playlist", "lazy_playlist": True, "quiet": True}) as ydl:
+            yield from iter_entries(url, cancel_token, ydl)
+        return
+    info = ydl.extract_info(url, download=False, process=False)
+    if info.get("_type", "video") == "video":
+        yield {"url": info.get("webpage_url") or url, "id": info.get("id"), "title": info.get("title")}
+        return
+    for entry in info.get("entries") or []:
+        if cancel_token is not None:
+            cancel_token.check()
+        if not entry:
+            continue
+        entry_url = entry.get("url") or entry.get("webpage_url")
+        # A nested listing (a channel's tabs, a tab's playlists) comes back as
+        # a playlist or as a link handled by the same extractor as its parent.
+        nested = entry.get("_type") == "playlist" or (
+            entry.get("ie_key") and entry.get("ie_key") == info.get("extractor_key"))
+        if nested:
+            if _depth < MAX_DEPTH and entry_url:
+                yield from iter_entries(entry_url, cancel_token, ydl, _depth + 1)
+            continue
+        if entry_url:
+            yield {"url": entry_url, "id": entry.get("id"), "title": entry.get("title")}
+
+
+def entry_job(template, entry, index):
+    """DownloadJob for one playlist entry, numbered and named after its title."""
+    from yt_dlp.utils import sanitize_filename
+    title = sanitize_filename(entry.get("title") or entry.get("id") or "video")
+    job = DownloadJob(entry["url"], template.folder, f"{template.name} - {index:04d} - {title}", template.quality)
+    for field in INHERITED_FIELDS:
+        setattr(job, field, getattr(template, field))
+    job.on_progress = template.on_progress
+    return job
+
+
+class PlaylistExpansion:
+    """Lists a playlist on a background thread and submits every entry at once.
+
+    submit(job) is called for each entry as soon as the listing yields it,
+    so the first downloads start while later pages are still being fetched.
+    Only jobs that have not finished yet are kept (for cancel()); call
+    job_done() from the pipeline's state callback. on_listed() runs when the
+    listing is complete.
+    """
+
+    def __init__(self, template, submit, on_listed=None):
+        self.template = template
+        self.submit = submit
+        self.on_listed = on_listed
+        self.cancel_token = CancelToken()
+        self.listed = 0
+        self.done = 0
+        self.listing_done = False
+        self.error = None
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="playlist", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        try:
+            for entry in iter_entries(self.template.url, self.cancel_token):
+                with self._lock:
+                    # Checked under the lock so cancel() cannot miss this entry.
+                    if self.cancel_token.cancelled:
+                        break
+                    self.listed += 1
+                    job = entry_job(self.template, entry, self.listed)
+                    self._active.add(job)
+                self.submit(job)
+        except Exception as e:
+            if not self.cancel_token.cancelled:
+                self.error = e
+                print(f"❌ Playlist listing failed after {self.listed} entries: {e}")
+        finally:
+            with self._lock:
+                self.listing_done = True
+            if self.on_listed is not None:
+                self.on_listed(self)
+
+    def job_done(self, job):
+        """Forget a finished job; True once the listing and all its jobs are done."""
+        with self._lock:
+            if job in self._active:
+                self._active.discard(job)
+                self.done += 1
+            return self.listing_done and not self._active
+
+    @property
+    def finished(self):
+        with self._lock:
+            return self.listing_done and not self._active
+
+    def cancel(self):
+        self.cancel_token.cancel()
+        with self._lock:
+            jobs = list(self._active)
+        for job in jobs:
+            job.cancel()
@@ -0,0 +1,90 @@
+import subprocess
+import threading
+import time
+from utils.binaries import ffmpeg_path
+
+# Named x264/AAC settings shared by the converter and the trimmers.
+ENCODE_PROFILES = {
+    "archive": {"preset": "slow", "crf": 18, "audio_bitrate": "192k"},
+    "balanced": {"preset": "fast", "crf": 22, "audio_bitrate": "192k"},
+    "fast-preview": {"preset": "ultrafast", "crf": 28, "audio_bitrate": "96k"},
+}
+DEFAULT_PROFILE = "balanced"
+# "auto" picks the x264 preset from measured speed and a target turnaround.
+PROFILE_NAMES = tuple(ENCODE_PROFILES) + ("auto",)
+
+# Slowest (best compression) first; auto mode walks this list. The slower
+# x264 presets are left out as they cost a lot for very little gain.
+X264_PRESETS = ["slow", "medium", "fast", "faster", "veryfast", "superfast", "ultrafast"]
+BENCHMARK_SIZE = (1280, 720)
+BENCHMARK_SECONDS = 2
+BENCHMARK_FPS = 30
+
+_measured_fps = {}
+_measure_lock = threading.Lock()
+
+
+def get_profile(name=DEFAULT_PROFILE):
+    if name not in ENCODE_PROFILES:
+        raise ValueError(f"Unknown encode profile: {name}")
+    return dict(ENCODE_PROFILES[name], name=name)
+
+
+def video_args(profile):
+    return ["-c:v", "libx264", "-preset", profile["preset"], "-crf", str(profile["crf"])]
+
+
+def audio_args(profile):
+    return ["-c:a", "aac", "-b:a", profile["audio_bitrate"]]
+
+
+def measure_encode_fps(preset):
+    """Encode a synthetic 720p clip with preset and return frames per second.
+
+    Results are kept for the lifetime of the process, so each preset is only
+    measured once per machine run.
+    """
+    with _measure_lock:
+        if preset in _measured_fps:
+            return _measured_fps[preset]
+        width, height = BENCHMARK_SIZE
+        command = [
+            ffmpeg_path(), "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={BENCHMARK_FPS}",
+            "-t", str(BENCHMARK_SECONDS),
+            "-c:v", "libx264", "-preset", preset, "-f", "null", "-",
+        ]
+        started = time.perf_counter()
+        subprocess.run(command, check=True)
+        elapsed = time.perf_counter() - started
+        _measured_fps[preset] = BENCHMARK_FPS * BENCHMARK_SECONDS / max(elapsed, 1e-6)
+        return _measured_fps[preset]
+
+
+def auto_profile(duration, target_seconds, height=None, fps=None):
+    """Pick the slowest x264 preset expected to encode within target_seconds.
+
+    The benchmark speed is scaled by the pixel count of the source (height,
+    assuming 16:9) so a 4K source is expected to encode ~9x slower than the
+    720p benchmark. Quality settings come from the balanced profile; when
+    even ultrafast cannot make the target it is used anyway.
+    """
+    profile = get_profile(DEFAULT_PROFILE)
+    profile["name"] = "auto"
+    frames = (duration or 0) * (fps or BENCHMARK_FPS)
+    pixel_scale = ((height or BENCHMARK_SIZE[1]) / BENCHMARK_SIZE[1]) ** 2
+    profile["preset"] = X264_PRESETS[-1]
+    for preset in X264_PRESETS:
+        expected = frames * pixel_scale / measure_encode_fps(preset)
+        if expected <= target_seconds:
+            profile["preset"] = preset
+            break
+    return profile
+
+
+def resolve_profile(name, media=None, target_seconds=None):
+    """Turn a profile name into settings; "auto" needs probed media info."""
+    if name != "auto":
+        return get_profile(name)
+    media = media or {}
+    return auto_profile(media.get("duration"), target_seconds or 60, media.get("height"), media.get("fps"))
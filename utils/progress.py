@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+
+# Flags that make ffmpeg write key=value progress blocks to stdout.
+FFMPEG_PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+
+def download_event(d):
+    """Turn a yt-dlp progress hook dict into a progress event.
+
+    Events are plain dicts: "stage", "status" and, when known, "percent",
+    "downloaded_bytes", "total_bytes", "bytes_per_second" and "eta"
+    (seconds). Conversion events carry "fps" and "speed" (x realtime)
+    instead of byte counts.
+    """
+    total = d.get("total_bytes") or d.get("total_bytes_estimate")
+    downloaded = d.get("downloaded_bytes")
+    event = {
+        "stage": "download",
+        "status": d.get("status"),
+        "downloaded_bytes": downloaded,
+        "total_bytes": total,
+        "bytes_per_second": d.get("speed"),
+        "eta": d.get("eta"),
+        "format_id": (d.get("info_dict") or {}).get("format_id"),
+        # The .part file while downloading, the final file once finished.
+        "filename": d.get("tmpfilename") or d.get("filename"),
+    }
+    if total and downloaded is not None:
+        event["percent"] = min(100.0, downloaded * 100.0 / total)
+    if d.get("status") == "finished":
+        event["percent"] = 100.0
+    return event
+
+
+class FfmpegProgress:
+    """Line parser for ffmpeg's -progress output.
+
+    Feed it stdout lines; every completed block ("progress=..." line) is
+    turned into an event for callback. percent and eta need the duration of
+    the whole output; offset shifts out_time for multi-step jobs.
+    """
+
+    def __init__(self, callback, duration=None, stage="convert", offset=0.0):
+        self.callback = callback
+        self.duration = duration
+        self.stage = stage
+        self.offset = offset
+        self._block = {}
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return
+        self._block[key] = value
+        if key == "progress":
+            self._emit(self._block)
+            self._block = {}
+
+    def _emit(self, block):
+        out_time = self.offset
+        try:
+            out_time += int(block.get("out_time_us", "0")) / 1_000_000
+        except ValueError:
+            pass  # "N/A" before the first frame
+        speed = _float(block.get("speed", "").rstrip("x"))
+        event = {
+            "stage": self.stage,
+            "status": "finished" if block.get("progress") == "end" else "processing",
+            "out_time": out_time,
+            "fps": _float(block.get("fps")),
+            "speed": speed,
+        }
+        if self.duration:
+            event["percent"] = min(100.0, out_time * 100.0 / self.duration)
+            if speed:
+                event["eta"] = max(0.0, (self.duration - out_time) / speed)
+        self.callback(event)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProgressThrottle:
+    """Rate-limit progress callbacks per (job, stage).
+
+    yt-dlp calls its hooks for every chunk and ffmpeg reports twice a
+    second per process; forwarding all of that to a Qt signal floods the
+    event loop. At most one event per interval seconds is passed on for each
+    job and stage, but "finished" events always go through.
+    """
+
+    def __init__(self, callback, interval=0.25):
+        self.callback = callback
+        self.interval = interval
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, job, event):
+        now = time.monotonic()
+        key = (id(job), event.get("stage"))
+        with self._lock:
+            if event.get("status") != "finished" and now - self._last.get(key, 0) < self.interval:
+                return
+            self._last[key] = now
+        self.callback(job, event)
+
+
+class JsonlProgressLog:
+    """Append progress events to a JSON-lines file, one object per event."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, job, event):
+        record = dict(event, time=time.time(), job=job.output_name, url=job.url)
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def fan_out(*callbacks):
+    """Combine progress callbacks, skipping None."""
+    callbacks = [c for c in callbacks if c is not None]
+
+    def emit(job, event):
+        for callback in callbacks:
+            callback(job, event)
+    return emit
+
+
+def format_event(event):
+    """Short human readable summary, e.g. "42% 3.1 MiB/s ETA 12s"."""
+    parts = []
+    if event.get("percent") is not None:
+        parts.append(f"{event['percent']:.0f}%")
+    if event.get("bytes_per_second"):
+        parts.append(f"{event['bytes_per_second'] / 2**20:.1f} MiB/s")
+    if event.get("fps"):
+        parts.append(f"{event['fps']:.0f} fps")
+    if event.get("speed"):
+        parts.append(f"{event['speed']:.1f}x")
+    if event.get("eta") is not None:
+        parts.append(f"ETA {event['eta']:.0f}s")
+    return " ".join(parts)
@@ -0,0 +1,258 @@
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# HTTP statuses that mean "slow down" rather than "broken".
+THROTTLE_STATUSES = (403, 429)
+# Backoff after the n-th throttle response in a row: BACKOFF_BASE * 2**n,
+# at most BACKOFF_MAX seconds, with jitter so workers do not retry in step.
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 300.0
+
+_SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text):
+    """Bytes per second from "500K", "2M", "1.5G" or a plain number; 0/None means unlimited."""
+    if text in (None, ""):
+        return None
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)(?:i?B)?(?:/s)?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Bad rate: {text!r}")
+    rate = float(match.group(1)) * _SIZE_SUFFIXES[match.group(2).upper()]
+    return rate or None
+
+
+def parse_schedule(entries):
+    """Parse "HH:MM-HH:MM=RATE" entries into (start_minute, end_minute, rate) windows.
+
+    A window may wrap past midnight ("22:00-06:00=10M").
+    """
+    windows = []
+    for entry in entries or []:
+        match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)", entry)
+        if not match:
+            raise ValueError(f"Bad schedule entry: {entry!r} (expected HH:MM-HH:MM=RATE)")
+        h1, m1, h2, m2, rate = match.groups()
+        windows.append((int(h1) * 60 + int(m1), int(h2) * 60 + int(m2), parse_rate(rate)))
+    return windows
+
+
+def backoff_delay(strikes, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Exponential backoff with "equal jitter": half fixed, half random."""
+    delay = min(cap, base * 2 ** max(0, strikes - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_sleep(n):
+    """yt-dlp retry_sleep_functions entry: ~1s, 2s, 4s... with jitter between its own retries."""
+    return backoff_delay(n + 1, base=1.0, cap=30.0)
+
+
+def throttle_status(error):
+    """The 403/429 status an error from yt-dlp reports, or None."""
+    match = re.search(r"HTTP Error (\d{3})", str(error))
+    status = int(match.group(1)) if match else None
+    return status if status in THROTTLE_STATUSES else None
+
+
+def host_of(url):
+    """The site a URL belongs to, "www." stripped ("youtube.com")."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _wait(seconds, cancel_token=None):
+    if seconds <= 0:
+        return
+    if cancel_token is not None:
+        cancel_token.wait(seconds)
+        cancel_token.check()
+    else:
+        time.sleep(seconds)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second.
+
+    consume() never refuses: a caller that takes more than is available
+    puts the bucket in debt and sleeps until it is paid back, so callers
+    are served in turn and the long-run total stays at rate. burst is how
+    far the bucket fills while nobody consumes (default: one second's
+    worth). A rate of None means unlimited.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self._rate = rate or None
+        self._burst = burst
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        """Change the rate; takes effect for the next consume()."""
+        with self._lock:
+            self._refill()
+            self._rate = rate or None
+            if self._rate is not None:
+                self._tokens = min(self._tokens, self._capacity())
+
+    def _capacity(self):
+        return self._burst or self._rate
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate is not None:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._stamp) * self._rate)
+        self._stamp = now
+
+    def consume(self, amount, cancel_token=None):
+        with self._lock:
+            if self._rate is None:
+                return
+            self._refill()
+            self._tokens -= amount
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        _wait(wait, cancel_token)
+
+
+class BandwidthLimiter(TokenBucket):
+    """Process-wide byte budget; schedule windows override the base rate.
+
+    rate and schedule may be changed at any time (set_rate /
+    set_schedule); the scheduled rate is looked up on every consume().
+    """
+
+    def __init__(self, rate=None, schedule=None):
+        self.base_rate = rate or None
+        self.schedule = list(schedule or [])
+        super().__init__(self.current_rate())
+
+    def set_rate(self, rate):
+        self.base_rate = rate or None
+        super().set_rate(self.current_rate())
+
+    def set_schedule(self, schedule):
+        self.schedule = list(schedule or [])
+        super().set_rate(self.current_rate())
+
+    def current_rate(self):
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end, rate in self.schedule:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return rate
+        return self.base_rate
+
+    def consume(self, amount, cancel_token=None):
+        rate = self.current_rate()
+        if rate != self.rate:
+            super().set_rate(rate)
+        super().consume(amount, cancel_token)
+
+
+class HostLimiter:
+    """Per-site caps on connections and request rate, plus throttle backoff.
+
+    Sites are keyed by host_of(job.url). max_connections caps the
+    connections (fragment downloads) all jobs of one site hold together;
+    requests_per_second paces requests to it (page loads and fragments).
+    When a site answers 403/429, penalize() puts it in a cooldown that
+    grows exponentially (with jitter) while the throttling goes on; every
+    request to it waits the cooldown out.
+    """
+
+    def __init__(self, max_connections=None, requests_per_second=None):
+        self.max_connections = max_connections or None
+        self.requests_per_second = requests_per_second or None
+        self._cond = threading.Condition()
+        self._in_use = {}
+        self._buckets = {}
+        self._cooldown_until = {}
+        self._strikes = {}
+
+    def acquire(self, host, wanted):
+        """Block until the site has a free connection; returns the grant."""
+        with self._cond:
+            if self.max_connections is None:
+                return wanted
+            while self._in_use.get(host, 0) >= self.max_connections:
+                self._cond.wait()
+            grant = max(1, min(wanted, self.max_connections - self._in_use.get(host, 0)))
+            self._in_use[host] = self._in_use.get(host, 0) + grant
+            return grant
+
+    def release(self, host, grant):
+        with self._cond:
+            if self.max_connections is None:
+                return
+            self._in_use[host] = max(0, self._in_use.get(host, 0) - grant)
+            self._cond.notify_all()
+
+    def request(self, host, cancel_token=None):
+        """Wait until one more request to host is allowed."""
+        with self._cond:
+            cooldown = self._cooldown_until.get(host, 0) - time.monotonic()
+            if self.requests_per_second is not None and host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.requests_per_second, burst=1)
+            bucket = self._buckets.get(host)
+        _wait(cooldown, cancel_token)
+        if bucket is not None:
+            bucket.consume(1, cancel_token)
+
+    def penalize(self, host):
+        """Record a throttle response from host; returns the cooldown in seconds."""
+        with self._cond:
+            self._strikes[host] = self._strikes.get(host, 0) + 1
+            delay = backoff_delay(self._strikes[host])
+            self._cooldown_until[host] = max(self._cooldown_until.get(host, 0), time.monotonic() + delay)
+            return delay
+
+    def succeeded(self, host):
+        with self._cond:
+            self._strikes.pop(host, None)
+
+
+class RateLimits:
+    """The bandwidth and per-site limits shared by every download of the process."""
+
+    def __init__(self, bandwidth=None, schedule=None, host_connections=None, host_requests=None):
+        self.bandwidth = BandwidthLimiter(bandwidth, schedule)
+        self.hosts = HostLimiter(host_connections, host_requests)
+
+    def progress_hook(self, host, cancel_token=None):
+        """yt-dlp progress hook charging a download's bytes and fragment requests.
+
+        Sleeping in the hook stalls that download's reads, which is what
+        keeps all downloads together under the bandwidth cap.
+        """
+        seen = {}
+        # Concurrent fragment threads all call the hook.
+        lock = threading.Lock()
+
+        def hook(d):
+            if d.get("status") != "downloading":
+                return
+            key = d.get("tmpfilename") or d.get("filename")
+            downloaded = d.get("downloaded_bytes") or 0
+            fragment = d.get("fragment_index")
+            with lock:
+                last_bytes, fragments = seen.setdefault(key, (0, set()))
+                new_fragment = fragment is not None and fragment not in fragments
+                if new_fragment:
+                    fragments.add(fragment)
+                # Reports can arrive out of order; charge each byte and fragment once.
+                seen[key] = (max(downloaded, last_bytes), fragments)
+            # Waiting happens outside the lock so other threads keep reporting.
+            if new_fragment:
+                self.hosts.request(host, cancel_token)
+            if downloaded > last_bytes:
+                self.bandwidth.consume(downloaded - last_bytes, cancel_token)
+        return hook
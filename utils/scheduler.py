@@ -0,0 +1,243 @@
+import collections
+import os
+import threading
+import traceback
+from utils.cancel import JobCancelled
+
+# Job states reported through the on_state callback.
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Extra states reported by Pipeline for its two stages.
+DOWNLOADING = "downloading"
+CONVERT_QUEUED = "convert-queued"
+CONVERTING = "converting"
+# (waiting, running) state of each stage of a download -> convert job.
+STAGE_STATES = {"download": (QUEUED, DOWNLOADING), "convert": (CONVERT_QUEUED, CONVERTING)}
+
+
+def outcome(error=None, result=None):
+    """(state, detail) a job ends with: FINISHED and its result, CANCELLED, or FAILED and the traceback."""
+    if error is None:
+        return FINISHED, result
+    if isinstance(error, JobCancelled):
+        return CANCELLED, None
+    return FAILED, "".join(traceback.format_exception(type(error), error, error.__traceback__))
+
+
+def split_cores(workers, load):
+    """Encoder threads for a conversion starting now.
+
+    The cores are divided by the number of conversions expected to run
+    side by side (load, running plus queued, capped by the workers): a
+    short queue gets few jobs with many threads each, a deep one many
+    single-threaded jobs, which x264 turns into more files per hour.
+    """
+    cores = os.cpu_count() or 1
+    return max(1, cores // min(workers, max(1, load)))
+
+
+class JobStates:
+    """The download -> convert state machine every job runner reports through.
+
+    Pipeline (thread pools) and utils.engine.AsyncEngine (asyncio) call
+    queued() and started() as a job enters and starts each stage of
+    STAGE_STATES and ended() once at the end, so both report the same
+    states in the same order and end jobs the same way.
+    """
+
+    def __init__(self, on_state=None):
+        self.on_state = on_state
+
+    def report(self, key, state, detail=None):
+        if self.on_state is not None:
+            self.on_state(key, state, detail)
+
+    def queued(self, key, stage):
+        self.report(key, STAGE_STATES[stage][0])
+
+    def started(self, key, stage):
+        self.report(key, STAGE_STATES[stage][1])
+
+    def ended(self, key, error=None, result=None):
+        self.report(key, *outcome(error, result))
+
+
+class JobScheduler:
+    """Bounded worker pool that runs jobs off the caller's thread.
+
+    Jobs are (key, work) pairs where work is a callable taking no arguments.
+    on_state(key, state, detail) is called from the worker threads whenever a
+    job changes state; detail is the work's return value when finished or
+    the traceback text when it failed. GUI front-ends forward it to a Qt
+    signal, which is safe to emit from any thread.
+    """
+
+    def __init__(self, max_workers=3, on_state=None):
+        self.on_state = on_state
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._threads = 0
+        self._active = 0
+        self._max_workers = 1
+        self.set_max_workers(max_workers)
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_max_workers(self, max_workers):
+        """Change the concurrency limit; running jobs are never interrupted."""
+        with self._cond:
+            self._max_workers = max(1, int(max_workers))
+            while self._threads < self._max_workers:
+                self._threads += 1
+                threading.Thread(target=self._worker, daemon=True).start()
+            self._cond.notify_all()
+
+    def submit(self, key, work):
+        self._report(key, QUEUED)
+        with self._cond:
+            self._pending.append((key, work))
+            self._cond.notify()
+
+    def load(self):
+        """Number of jobs running or waiting right now."""
+        with self._cond:
+            return self._active + len(self._pending)
+
+    def join(self):
+        """Block until every submitted job has finished."""
+        with self._cond:
+            while self._pending or self._active:
+                self._cond.wait()
+
+    def _report(self, key, state, detail=None):
+        if self.on_state is not None:
+            self.on_state(key, state, detail)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                # Threads above a lowered limit simply stay parked here.
+                while not self._pending or self._active >= self._max_workers:
+                    self._cond.wait()
+                key, work = self._pending.popleft()
+                self._active += 1
+            self._report(key, RUNNING)
+            try:
+                result = work()
+            except Exception as e:
+                self._report(key, *outcome(e))
+            else:
+                self._report(key, *outcome(result=result))
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._cond.notify_all()
+
+
+class ConnectionBudget:
+    """Global cap on the HTTP connections all running downloads may open.
+
+    Each download asks for the fragment concurrency it wants and is granted
+    as much of it as is free, while one connection is held back for every
+    other download slot of scheduler that has no grant yet. A lone job can
+    therefore use (almost) the whole budget, parallel jobs never add up to
+    more than total, and a job starting late still gets at least one
+    connection. Grants are fixed for the life of a download.
+    """
+
+    def __init__(self, total=16, scheduler=None):
+        self.total = max(1, int(total))
+        self.scheduler = scheduler
+        self._in_use = 0
+        self._holders = 0
+        self._cond = threading.Condition()
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def acquire(self, wanted):
+        """Block until at least one connection is free and return the grant."""
+        with self._cond:
+            while True:
+                slots = self.scheduler.max_workers if self.scheduler is not None else 1
+                reserved = max(0, slots - self._holders - 1)
+                free = self.total - self._in_use
+                if free >= 1:
+                    grant = min(max(1, wanted), max(1, free - reserved))
+                    self._in_use += grant
+                    self._holders += 1
+                    return grant
+                self._cond.wait()
+
+    def release(self, grant):
+        with self._cond:
+            self._in_use -= grant
+            self._holders -= 1
+            self._cond.notify_all()
+
+
+class Pipeline:
+    """Two-stage download -> convert pipeline with a pool per stage.
+
+    Downloads are network bound and conversions CPU bound, so each stage has
+    its own concurrency limit: a finished download is queued for conversion
+    and its download slot is handed to the next job straight away. The
+    conversion pool defaults to one worker per core, and each conversion is
+    meant to ask conversion_threads() how many encoder threads it may use,
+    so the cores are split between whatever is converting instead of every
+    ffmpeg grabbing all of them. connections is the
+    ConnectionBudget shared by all downloads (see utils.jobs.download).
+    on_state(key, state, detail) reports QUEUED, DOWNLOADING, CONVERT_QUEUED,
+    CONVERTING, FINISHED, FAILED and CANCELLED.
+    """
+
+    def __init__(self, download_workers=3, convert_workers=None, on_state=None, max_connections=16):
+        self.states = JobStates(on_state)
+        self._convert_work = {}
+        self._lock = threading.Lock()
+        self.downloads = JobScheduler(download_workers, on_state=self._download_state)
+        self.conversions = JobScheduler(convert_workers or os.cpu_count() or 1, on_state=self._convert_state)
+        self.connections = ConnectionBudget(max_connections, self.downloads)
+
+    def submit(self, key, download_work, convert_work=None):
+        """Queue download_work; convert_work (if any) runs once it succeeds."""
+        with self._lock:
+            self._convert_work[key] = convert_work
+        self.downloads.submit(key, download_work)
+
+    def conversion_threads(self):
+        """Encoder threads for a conversion starting now (see split_cores)."""
+        return split_cores(self.conversions.max_workers, self.conversions.load())
+
+    def join(self):
+        """Block until both stages have drained."""
+        self.downloads.join()
+        self.conversions.join()
+
+    def _download_state(self, key, state, detail):
+        if state == QUEUED:
+            self.states.queued(key, "download")
+        elif state == RUNNING:
+            self.states.started(key, "download")
+        else:
+            with self._lock:
+                convert_work = self._convert_work.pop(key, None)
+            if state == FINISHED and convert_work is not None:
+                self.conversions.submit(key, convert_work)
+            else:
+                self.states.report(key, state, detail)
+
+    def _convert_state(self, key, state, detail):
+        if state == QUEUED:
+            self.states.queued(key, "convert")
+        elif state == RUNNING:
+            self.states.started(key, "convert")
+        else:
+            self.states.report(key, state, detail)
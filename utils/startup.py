@@ -0,0 +1,77 @@
+import contextlib
+import json
+import threading
+import time
+
+# Imported first by the GUI entry points, so this is roughly when their
+# Python code started running (interpreter and bundle start-up not included).
+PROCESS_STARTED = time.perf_counter()
+
+
+class StartupTimer:
+    """Collects start-up milestones and warm-up durations for a timing report.
+
+    mark() records the time since PROCESS_STARTED (imports done, window built,
+    first paint); measure() records how long a block took (warm-up steps).
+    """
+
+    def __init__(self):
+        self.marks = {}
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        with self._lock:
+            self.marks[name] = time.perf_counter() - PROCESS_STARTED
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.durations[name] = time.perf_counter() - started
+
+    def summary(self):
+        with self._lock:
+            marks = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.marks.items())
+            steps = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.durations.items())
+        return marks + (f" | warm-up: {steps}" if steps else "")
+
+    def report(self, path=None):
+        """Print the timings and, with path, append them as one JSON line."""
+        print(f"🚀 Startup: {self.summary()}")
+        if path:
+            with self._lock:
+                record = {"time": time.time(), "marks": self.marks, "durations": self.durations}
+                with open(path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(record) + "\n")
+
+
+def warm_up(timer=None, on_done=None):
+    """Import yt-dlp, load its extractors and resolve ffmpeg on a background thread.
+
+    The first download then starts without that delay, while the window is
+    already on screen. Errors are only reported here; the real call will
+    raise them again. Returns the thread.
+    """
+    timer = timer or StartupTimer()
+
+    def run():
+        try:
+            with timer.measure("yt_dlp import"):
+                import yt_dlp
+            with timer.measure("extractors"):
+                yt_dlp.extractor.gen_extractor_classes()
+            with timer.measure("ffmpeg"):
+                from utils.binaries import ffmpeg_path
+                ffmpeg_path()
+        except Exception as e:
+            print(f"⚠️ Warm-up failed: {e}")
+        if on_done is not None:
+            on_done()
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
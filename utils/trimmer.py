@@ -1,5 +1,176 @@
-def trim_args(start,end):
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from utils.binaries import ffmpeg_path
+from utils.profiles import DEFAULT_PROFILE, resolve_profile, video_args, audio_args
+from utils.cancel import run_process
+from utils.progress import FFMPEG_PROGRESS_ARGS, FfmpegProgress
+
+# Codecs whose bitstream can be copied into MPEG-TS segments and re-joined.
+SMART_CUT_VIDEO_CODECS = ("avc1", "h264", "hev1", "hvc1", "hevc")
+
+
+def trim_args(start, end, profile=DEFAULT_PROFILE, target_seconds=None):
+    duration = time_to_seconds(end) - time_to_seconds(start)
+    settings = resolve_profile(profile, {"duration": duration}, target_seconds)
     return {
         "ffmpeg_i": ["-ss", str(start), "-to", str(end)],
-        "ffmpeg_o": ["-c:v", "libx264", "-preset", "fast", "-c:a", "aac", "-b:a", "128k", "-f", "mp4"],
-    }
\ No newline at end of file
+        "ffmpeg_o": video_args(settings) + audio_args(settings) + ["-f", "mp4"],
+    }
+
+
+def time_to_seconds(time_str):
+    """Convert hh:mm:ss, mm:ss or plain seconds to a float."""
+    seconds = 0.0
+    for part in str(time_str).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def clip_sources(info):
+    """Return the (video, audio) format dicts yt-dlp picked for info.
+
+    Either may be None, and both are the same dict for muxed formats. Only
+    a codec of "none" means the stream is missing: direct URLs and HLS
+    often declare no codecs at all, and those formats are kept.
+    """
+    formats = info.get("requested_formats") or [info]
+    return _stream(formats, "vcodec"), _stream(formats, "acodec")
+
+
+def _stream(formats, codec_key):
+    present = [f for f in formats if f.get(codec_key) != "none"]
+    # A format that declares the codec beats one that leaves it unknown.
+    return next((f for f in present if f.get(codec_key)), present[0] if present else None)
+
+
+def _input_args(source, seek=None):
+    """ffmpeg arguments that open a format dict (or {"url": path}) at seek."""
+    args = []
+    headers = source.get("http_headers")
+    if headers:
+        args += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    if seek is not None:
+        args += ["-ss", f"{seek:.3f}"]
+    return args + ["-i", source["url"]]
+
+
+def _run(command, cancel_token=None, progress=None):
+    """Run ffmpeg quietly; progress is an optional FfmpegProgress to feed."""
+    if progress is not None:
+        command = FFMPEG_PROGRESS_ARGS + command
+    run_process([ffmpeg_path(), "-hide_banner", "-loglevel", "error", "-y"] + command, cancel_token,
+                on_stdout_line=progress and progress.feed)
+
+
+def list_keyframes(source, start, end, cancel_token=None):
+    """Return keyframe timestamps of source between start and end.
+
+    Only keyframes are decoded and, for remote sources, ffmpeg only fetches
+    the bytes around the window thanks to the input seek.
+    """
+    command = [ffmpeg_path(), "-hide_banner", "-skip_frame", "nokey", "-copyts"]
+    command += _input_args(source, start)
+    command += ["-t", f"{end - start:.3f}", "-an", "-vf", "showinfo", "-f", "null", "-"]
+    try:
+        result = run_process(command, cancel_token, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             text=True, errors="replace")
+    except subprocess.CalledProcessError as e:
+        result = e  # Keyframes read before a decode error are still usable
+    times = [float(t) for t in re.findall(r"pts_time:\s*(-?[\d.]+)", result.stderr)]
+    return sorted(t for t in times if start <= t <= end)
+
+
+def _encode_video(source, output_file, start, end, settings, cancel_token=None, progress=None):
+    _run(_input_args(source, start) + ["-t", f"{end - start:.3f}", "-an"]
+         + video_args(settings) + ["-pix_fmt", "yuv420p", output_file], cancel_token, progress)
+
+
+def smart_cut(video, audio, output_file, start, end, scan_window=10,
+              profile=DEFAULT_PROFILE, target_seconds=None, cancel_token=None, on_progress=None):
+    """Cut [start, end] (seconds) out of video/audio format dicts into output_file.
+
+    The sources are read with input seeking, so for http(s) URLs only the
+    byte ranges covering the window are fetched. When the video codec allows
+    it, only the partial GOPs at both ends are re-encoded (for a frame
+    accurate cut) and everything between the first and last keyframe in the
+    window is stream-copied. Audio is encoded for the window only. Encoding
+    uses the named profile from utils.profiles. Cancelling cancel_token
+    stops ffmpeg and leaves neither segments nor a partial output behind.
+    on_progress receives "trim" progress events across the whole window.
+    """
+    settings = resolve_profile(profile, {"duration": end - start, "height": video and video.get("height")},
+                               target_seconds)
+    if video is None and audio is None:
+        raise RuntimeError("No video or audio stream to cut into " + output_file)
+
+    def progress(offset):
+        """Parser for one ffmpeg step that starts offset seconds into the clip."""
+        if on_progress is None:
+            return None
+        return FfmpegProgress(on_progress, end - start, stage="trim", offset=offset)
+    if video is None:
+        # Audio-only clip; let ffmpeg pick the codec from the output extension.
+        try:
+            _run(_input_args(audio, start) + ["-t", f"{end - start:.3f}", "-vn", output_file], cancel_token,
+                 progress(0))
+        except BaseException:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
+        return
+
+    vcodec = (video.get("vcodec") or "").split(".")[0]
+    head_keys = []
+    tail_keys = []
+    if vcodec in SMART_CUT_VIDEO_CODECS:
+        head_keys = list_keyframes(video, start, min(end, start + scan_window), cancel_token)
+        tail_keys = list_keyframes(video, max(start, end - scan_window), end, cancel_token)
+
+    work_dir = tempfile.mkdtemp(prefix=".clip-", dir=os.path.dirname(output_file) or ".")
+    try:
+        segments = []
+        if head_keys and tail_keys and head_keys[0] < tail_keys[-1]:
+            first_key, last_key = head_keys[0], tail_keys[-1]
+            if first_key - start > 0.01:
+                segments.append(os.path.join(work_dir, "head.ts"))
+                _encode_video(video, segments[-1], start, first_key, settings, cancel_token, progress(0))
+            segments.append(os.path.join(work_dir, "middle.ts"))
+            # Nudge the seek past rounding so it lands on first_key itself, and
+            # stop just short of last_key, which starts the tail segment.
+            _run(_input_args(video, first_key + 0.001) + [
+                "-t", f"{last_key - first_key - 0.002:.3f}", "-an", "-c:v", "copy", segments[-1],
+            ], cancel_token, progress(first_key - start))
+            if end - last_key > 0.01:
+                segments.append(os.path.join(work_dir, "tail.ts"))
+                _encode_video(video, segments[-1], last_key, end, settings, cancel_token,
+                              progress(last_key - start))
+        else:
+            # No GOP fully inside the window (or a codec we cannot splice):
+            # the clip is short or unsplittable, so encode just the window.
+            segments.append(os.path.join(work_dir, "clip.ts"))
+            _encode_video(video, segments[-1], start, end, settings, cancel_token, progress(0))
+
+        # MPEG-TS segments carry SPS/PPS in-band, so re-encoded and copied
+        # pieces with different encoder settings can be joined.
+        concat_list = os.path.join(work_dir, "segments.txt")
+        with open(concat_list, "w", encoding="utf-8") as file:
+            for segment in segments:
+                file.write(f"file '{segment}'\n")
+        command = ["-f", "concat", "-safe", "0", "-i", concat_list]
+        if audio is not None:
+            command += _input_args(audio, start) + ["-t", f"{end - start:.3f}"]
+            # A source that does not declare its codecs may turn out to have no audio.
+            audio_map = "1:a" if audio.get("acodec") else "1:a?"
+            command += ["-map", "0:v", "-map", audio_map, "-c:v", "copy"] + audio_args(settings)
+        else:
+            command += ["-c", "copy"]
+        _run(command + ["-movflags", "+faststart", output_file], cancel_token)
+    except BaseException:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
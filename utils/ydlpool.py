@@ -0,0 +1,80 @@
+import contextlib
+import threading
+
+# Options whose value YoutubeDL keeps outside params once constructed; they
+# are re-applied by YoutubeDLPool.session instead of just updating params.
+HOOK_OPTIONS = ("progress_hooks", "postprocessor_hooks")
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances, one per worker thread.
+
+    Building a YoutubeDL loads cookies and sets up its HTTP handlers, and
+    its extractors cache player JS and other per-site state; a fresh
+    instance per job throws all of that (and any keep-alive connections)
+    away. session(opts) hands the calling thread its own instance with the
+    job's options laid over base_opts and puts everything back afterwards,
+    so jobs never see each other's outtmpl, format or hooks. Scheduler
+    workers are long-lived threads, so in a batch each instance serves many
+    jobs.
+    """
+
+    def __init__(self, base_opts=None):
+        self.base_opts = dict(base_opts or {})
+        self.created = 0
+        self.reused = 0
+        self._local = threading.local()
+        self._instances = []
+        self._lock = threading.Lock()
+
+    def _instance(self):
+        ydl = getattr(self._local, "ydl", None)
+        with self._lock:
+            if ydl is not None:
+                self.reused += 1
+                return ydl
+            self.created += 1
+        import yt_dlp  # Deferred so front-ends can show their window first
+        ydl = yt_dlp.YoutubeDL(dict(self.base_opts))
+        self._local.ydl = ydl
+        with self._lock:
+            self._instances.append(ydl)
+        return ydl
+
+    @contextlib.contextmanager
+    def session(self, opts):
+        """Yield this thread's YoutubeDL configured with opts for one job."""
+        ydl = self._instance()
+        saved_params = dict(ydl.params)
+        saved_hooks = list(ydl._progress_hooks), list(ydl._postprocessor_hooks)
+        saved_selector = ydl.format_selector
+        params = {key: value for key, value in opts.items() if key not in HOOK_OPTIONS}
+        if isinstance(params.get("outtmpl"), str):
+            # YoutubeDL normalised its own outtmpl to a dict of templates.
+            params["outtmpl"] = dict(ydl.params.get("outtmpl") or {}, default=params["outtmpl"])
+        try:
+            # Updated in place: extractors and downloaders hold this very dict.
+            ydl.params.update(params)
+            for hook in opts.get("progress_hooks", []):
+                ydl.add_progress_hook(hook)
+            for hook in opts.get("postprocessor_hooks", []):
+                ydl.add_postprocessor_hook(hook)
+            if "format" in params:
+                ydl.format_selector = ydl.build_format_selector(params["format"])
+            yield ydl
+        finally:
+            ydl.params.clear()
+            ydl.params.update(saved_params)
+            ydl._progress_hooks[:], ydl._postprocessor_hooks[:] = saved_hooks
+            ydl.format_selector = saved_selector
+
+    def stats(self):
+        with self._lock:
+            return {"created": self.created, "reused": self.reused}
+
+    def close(self):
+        """Close every instance (this also saves the cookie jar)."""
+        with self._lock:
+            instances, self._instances = self._instances, []
+        for ydl in instances:
+            ydl.close()